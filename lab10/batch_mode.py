@@ -0,0 +1,129 @@
+import argparse
+import csv
+import json
+import time
+
+import psycopg2
+from db_pool import get_connection
+
+# Non-interactive command files: every op runs on one pooled connection and
+# ops are committed in groups instead of one transaction per command.
+
+GROUP_SIZE = 1000
+
+
+def read_commands(filename):
+    """Yield (line_no, command dict) from a JSONL file or a CSV file with an `op` column"""
+    with open(filename, 'r', newline='') as f:
+        if filename.endswith('.csv'):
+            reader = csv.DictReader(f)
+            for command in reader:
+                yield reader.line_num, {k: v for k, v in command.items() if v not in (None, '')}
+            return
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                command = json.loads(line)
+            except ValueError as error:
+                yield line_no, {'op': None, 'error': f"bad JSON: {error}"}
+                continue
+            if not isinstance(command, dict):
+                yield line_no, {'op': None, 'error': f"expected a JSON object, got {type(command).__name__}"}
+                continue
+            yield line_no, command
+
+
+def run_op(cur, ops, command):
+    """Run one command, returns its result entry (DB errors propagate)"""
+    handler = ops.get(command.get('op'))
+    if handler is None:
+        raise ValueError(command.get('error') or f"unknown op {command.get('op')!r}")
+    handler(cur, command)
+    if cur.description is not None:
+        return {'status': 'ok', 'rows': [list(row) for row in cur.fetchall()]}
+    return {'status': 'ok', 'affected': cur.rowcount if cur.rowcount >= 0 else None}
+
+
+def run_group(conn, ops, group):
+    """Run a group in one transaction; on a DB error replay it with a savepoint per op"""
+    cur = conn.cursor()
+    results = []
+    try:
+        for line_no, command in group:
+            try:
+                result = run_op(cur, ops, command)
+            except (KeyError, ValueError) as error:
+                result = {'status': 'error', 'error': f"{type(error).__name__}: {error}"}
+            results.append((line_no, command, result))
+        conn.commit()
+        cur.close()
+        return results
+    except psycopg2.Error:
+        conn.rollback()
+
+    # replay: only the failing ops are lost, the rest of the group still commits
+    results = []
+    for line_no, command in group:
+        cur.execute("SAVEPOINT batch_op")
+        try:
+            result = run_op(cur, ops, command)
+            cur.execute("RELEASE SAVEPOINT batch_op")
+        except (KeyError, ValueError) as error:
+            cur.execute("RELEASE SAVEPOINT batch_op")
+            result = {'status': 'error', 'error': f"{type(error).__name__}: {error}"}
+        except psycopg2.Error as error:
+            cur.execute("ROLLBACK TO SAVEPOINT batch_op")
+            result = {'status': 'error', 'error': str(error).strip()}
+        results.append((line_no, command, result))
+    conn.commit()
+    cur.close()
+    return results
+
+
+def run_batch(filename, ops, results_path=None, group_size=GROUP_SIZE):
+    """Run every command in `filename` with the handlers in `ops`, returns a summary.
+
+    `ops` maps an op name to handler(cur, command), which executes one
+    statement. One JSON line per command is written to results_path.
+    """
+    results_path = results_path or f"{filename}.results.jsonl"
+    summary = {'commands': 0, 'ok': 0, 'errors': 0, 'groups': 0}
+    start = time.perf_counter()
+
+    def flush(group):
+        for line_no, command, result in run_group(conn, ops, group):
+            summary['commands'] += 1
+            summary['ok' if result['status'] == 'ok' else 'errors'] += 1
+            out.write(json.dumps(dict(result, line=line_no, op=command.get('op')), default=str) + "\n")
+        summary['groups'] += 1
+
+    with get_connection() as conn, open(results_path, 'w') as out:
+        group = []
+        for item in read_commands(filename):
+            group.append(item)
+            if len(group) >= group_size:
+                flush(group)
+                group = []
+        if group:
+            flush(group)
+
+    summary['seconds'] = time.perf_counter() - start
+    summary['ops_per_sec'] = summary['commands'] / summary['seconds'] if summary['seconds'] else 0.0
+    summary['results'] = results_path
+    print(f"Commands: {summary['commands']}  OK: {summary['ok']}  Errors: {summary['errors']}")
+    print(f"Time: {summary['seconds']:.2f}s ({summary['ops_per_sec']:.0f} ops/s, "
+          f"{summary['groups']} transactions)")
+    print(f"Results written to {results_path}")
+    return summary
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run phonebook commands from a JSONL or CSV file")
+    parser.add_argument('--batch', metavar='FILE', required=True,
+                        help="one command per line, e.g. {\"op\": \"add\", \"first_name\": ...}")
+    parser.add_argument('--results', help="results file (default FILE.results.jsonl)")
+    parser.add_argument('--group-size', type=int, default=GROUP_SIZE, help="commands per transaction")
+    parser.add_argument('--stats', action='store_true', help="print the latency summary on exit")
+    return parser.parse_args(argv)
@@ -1,8 +1,9 @@
 import psycopg2
-from config import config
+from migrate import migrate
 
-def create_game_tables():
-    commands = (
+# Snake game schema, applied once each by migrate.py
+GAME_MIGRATIONS = [
+    {'version': 1, 'name': 'users and user_score tables', 'steps': [
         """
         CREATE TABLE IF NOT EXISTS users (
             user_id SERIAL PRIMARY KEY,
@@ -18,22 +19,14 @@ def create_game_tables():
             CONSTRAINT unique_user_save UNIQUE (user_id) 
         )
         """
-    )
-    conn = None
+    ]},
+]
+
+def create_game_tables():
     try:
-        params = config()
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
-        for command in commands:
-            cur.execute(command)
-        conn.commit()
-        cur.close()
-        print("Game tables created successfully.")
+        migrate(GAME_MIGRATIONS, 'game')
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
-    finally:
-        if conn is not None:
-            conn.close()
 
 # Run this once to set up DB
 if __name__ == '__main__':
@@ -0,0 +1,192 @@
+import argparse
+import csv
+import heapq
+import os
+import shutil
+import tempfile
+import time
+
+import psycopg2
+from db_pool import get_connection
+
+# Dedupe stage in front of the importers: drops rows whose phone is already in
+# the file or in the phonebook, so the load itself never hits a unique key.
+# Up to max_keys rows are deduplicated in memory; larger files are cut into
+# sorted runs on disk and merged.
+
+MAX_KEYS = 1000000
+CHECK_BATCH = 5000
+
+
+def normalize_phone(raw):
+    """Same canonical form as the SQL normalize_phone() behind phone_norm"""
+    digits = ''.join(ch for ch in raw if '0' <= ch <= '9')
+    if not digits:
+        return None
+    if len(digits) == 11 and digits[0] == '8':
+        return '7' + digits[1:]
+    if len(digits) == 10:
+        return '7' + digits
+    return digits
+
+
+def valid_row(row):
+    if len(row) != 3:
+        return False
+    first_name, last_name, phone = (value.strip() for value in row)
+    return 0 < len(first_name) <= 255 and len(last_name) <= 255 and 0 < len(phone) <= 50
+
+
+def read_rows(f, report, rejects):
+    """Yield (line_no, key, row) for the well-formed rows, reject the rest"""
+    reader = csv.reader(f)
+    next(reader, None) # Skip header
+    for row in reader:
+        report['rows'] += 1
+        if not valid_row(row):
+            rejects.writerow([reader.line_num, 'malformed'] + row)
+            report['malformed'] += 1
+            continue
+        row = [value.strip() for value in row]
+        yield reader.line_num, normalize_phone(row[2]) or row[2], row
+
+
+def write_run(buffer, tmpdir, n):
+    """Sort one memory-sized chunk by (key, line) and spill it to disk"""
+    buffer.sort(key=lambda item: (item[1], item[0]))
+    path = os.path.join(tmpdir, f"run{n}.csv")
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        for line_no, key, row in buffer:
+            writer.writerow([line_no, key] + row)
+    return path
+
+
+def read_run(path):
+    with open(path, newline='') as f:
+        for line_no, key, *row in csv.reader(f):
+            yield int(line_no), key, row
+
+
+def unique_rows(rows, max_keys, tmpdir, report, rejects):
+    """Yield the first row per key; in file order if it fits in memory, else in key order"""
+    buffer = []
+    runs = []
+    for item in rows:
+        buffer.append(item)
+        if len(buffer) >= max_keys:
+            runs.append(write_run(buffer, tmpdir, len(runs)))
+            buffer = []
+
+    if not runs:
+        # in-memory hash set, original order kept
+        seen = set()
+        for line_no, key, row in buffer:
+            if key in seen:
+                rejects.writerow([line_no, 'duplicate'] + row)
+                report['duplicates'] += 1
+                continue
+            seen.add(key)
+            yield line_no, key, row
+        return
+
+    # external sort-merge: equal keys come out together, lowest line first
+    if buffer:
+        runs.append(write_run(buffer, tmpdir, len(runs)))
+    buffer = None
+    report['runs'] = len(runs)
+    previous = None
+    for line_no, key, row in heapq.merge(*(read_run(path) for path in runs),
+                                         key=lambda item: (item[1], item[0])):
+        if key == previous:
+            rejects.writerow([line_no, 'duplicate'] + row)
+            report['duplicates'] += 1
+            continue
+        previous = key
+        yield line_no, key, row
+
+
+def drop_existing(rows, cur, batch_size, report, rejects):
+    """Batched lookup against phonebook, one indexed ANY() query per batch"""
+    sql = """SELECT phone_norm, phone FROM phonebook
+             WHERE phone_norm = ANY(%s) OR phone = ANY(%s)"""
+
+    def check(batch):
+        cur.execute(sql, ([key for _, key, _ in batch], [row[2] for _, _, row in batch]))
+        existing = {value for pair in cur.fetchall() for value in pair if value is not None}
+        for line_no, key, row in batch:
+            if key in existing or row[2] in existing:
+                rejects.writerow([line_no, 'exists'] + row)
+                report['existing'] += 1
+            else:
+                yield line_no, key, row
+
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield from check(batch)
+            batch = []
+    if batch:
+        yield from check(batch)
+
+
+def dedupe_csv(filename, out_path=None, rejects_path=None, max_keys=MAX_KEYS,
+               check_db=True, batch_size=CHECK_BATCH):
+    """Write the rows of `filename` that are safe to load to out_path, returns a report"""
+    out_path = out_path or f"{filename}.dedup.csv"
+    rejects_path = rejects_path or f"{filename}.rejects.csv"
+    report = {'rows': 0, 'kept': 0, 'duplicates': 0, 'existing': 0, 'malformed': 0, 'runs': 0}
+    start = time.perf_counter()
+    tmpdir = tempfile.mkdtemp(prefix='phonebook_dedupe_')
+    try:
+        with open(filename, 'r', newline='') as f, \
+                open(out_path, 'w', newline='') as out, \
+                open(rejects_path, 'w', newline='') as rejects_file:
+            rejects = csv.writer(rejects_file)
+            rejects.writerow(['line', 'reason', 'first_name', 'last_name', 'phone'])
+            writer = csv.writer(out)
+            writer.writerow(['first_name', 'last_name', 'phone'])
+
+            rows = unique_rows(read_rows(f, report, rejects), max_keys, tmpdir, report, rejects)
+            if check_db:
+                with get_connection() as conn:
+                    cur = conn.cursor()
+                    for _, _, row in drop_existing(rows, cur, batch_size, report, rejects):
+                        writer.writerow(row)
+                        report['kept'] += 1
+                    cur.close()
+                    conn.commit()
+            else:
+                for _, _, row in rows:
+                    writer.writerow(row)
+                    report['kept'] += 1
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    report['seconds'] = time.perf_counter() - start
+    report['output'] = out_path
+    report['rejects'] = rejects_path
+    print(f"Kept: {report['kept']} of {report['rows']}  Dropped: {report['duplicates']} duplicate, "
+          f"{report['existing']} already stored, {report['malformed']} malformed")
+    if report['runs']:
+        print(f"Sorted on disk in {report['runs']} runs")
+    print(f"Clean file: {out_path}  Rejects: {rejects_path}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Drop duplicate and already stored phones from a contacts CSV")
+    parser.add_argument('filename')
+    parser.add_argument('--out', help="clean CSV (default FILE.dedup.csv)")
+    parser.add_argument('--rejects', help="dropped rows with reasons (default FILE.rejects.csv)")
+    parser.add_argument('--max-keys', type=int, default=MAX_KEYS,
+                        help="rows deduplicated in memory before spilling sorted runs to disk")
+    parser.add_argument('--no-db', action='store_true', help="skip the check against the phonebook table")
+    args = parser.parse_args()
+    try:
+        dedupe_csv(args.filename, args.out, args.rejects, args.max_keys, not args.no_db)
+    except FileNotFoundError:
+        print("File not found")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
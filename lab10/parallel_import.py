@@ -0,0 +1,215 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+import psycopg2.errors
+from psycopg2.extras import execute_values
+from config import config
+
+# Parallel CSV ingest: the file is cut into byte ranges on line boundaries and
+# every range is loaded by its own process over its own connection.
+# Shards are split on newlines, so quoted fields must not contain line breaks
+# (true for data.csv and everything gen_contacts.py writes).
+
+BATCH_SIZE = 5000
+DEADLOCK_RETRIES = 5
+
+INSERT_SQL = """INSERT INTO phonebook(first_name, last_name, phone) VALUES %s
+                ON CONFLICT DO NOTHING RETURNING phone"""
+
+
+def find_shards(filename, workers):
+    """Split the file after its header into up to `workers` (start, end) byte ranges"""
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        f.readline() # Skip header
+        bounds = [f.tell()]
+        for i in range(1, workers):
+            pos = bounds[0] + (size - bounds[0]) * i // workers
+            if pos <= bounds[-1]:
+                continue
+            # move forward to the start of the next line
+            f.seek(pos - 1)
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+        bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def read_shard(f, start, end):
+    """Yield the raw lines that start inside [start, end)"""
+    f.seek(start)
+    pos = start
+    while pos < end:
+        raw = f.readline()
+        if not raw:
+            break
+        pos += len(raw)
+        yield raw
+
+
+def parse_row(raw):
+    """Return (first_name, last_name, phone) or None for a malformed line"""
+    try:
+        row = next(csv.reader([raw.decode('utf-8')]), [])
+    except (UnicodeDecodeError, csv.Error):
+        return None
+    if len(row) != 3:
+        return None
+    first_name, last_name, phone = (value.strip() for value in row)
+    if not (0 < len(first_name) <= 255 and len(last_name) <= 255 and 0 < len(phone) <= 50):
+        return None
+    return first_name, last_name, phone
+
+
+def insert_batch(conn, cur, batch, errors, report):
+    """Insert one batch; every row that hits a unique key is reported, the rest commit"""
+    rows = []
+    seen = set()
+    for line_no, text, row in batch:
+        if row[2] in seen:
+            errors.writerow([line_no, 'duplicate', text])
+            report['duplicates'] += 1
+            continue
+        seen.add(row[2])
+        rows.append((line_no, text, row))
+    # same lock order in every worker, so overlapping batches rarely deadlock
+    rows.sort(key=lambda item: item[2][2])
+
+    for attempt in range(DEADLOCK_RETRIES):
+        try:
+            inserted = execute_values(cur, INSERT_SQL, [row for _, _, row in rows],
+                                      page_size=len(rows) or 1, fetch=True)
+            conn.commit()
+            break
+        except psycopg2.errors.DeadlockDetected:
+            conn.rollback()
+            if attempt == DEADLOCK_RETRIES - 1:
+                raise
+
+    inserted = {phone for (phone,) in inserted}
+    for line_no, text, row in rows:
+        if row[2] in inserted:
+            report['loaded'] += 1
+        else:
+            # already stored, loaded by another shard, or same number in another format
+            errors.writerow([line_no, 'duplicate', text])
+            report['duplicates'] += 1
+
+
+def load_shard(filename, shard_no, start, end, error_path, batch_size=BATCH_SIZE):
+    """Worker: load one byte range, write rejected lines to error_path.
+
+    Line numbers in the error file are relative to the shard; the merge
+    step turns them into file line numbers.
+    """
+    report = {'shard': shard_no, 'lines': 0, 'loaded': 0, 'duplicates': 0, 'malformed': 0}
+    began = time.perf_counter()
+    # a fresh connection, never one inherited from the parent's pool
+    conn = psycopg2.connect(**config())
+    try:
+        cur = conn.cursor()
+        with open(filename, 'rb') as f, open(error_path, 'w', newline='') as err_file:
+            errors = csv.writer(err_file)
+            batch = []
+            for raw in read_shard(f, start, end):
+                report['lines'] += 1
+                text = raw.decode('utf-8', 'replace').rstrip('\r\n')
+                row = parse_row(raw)
+                if row is None:
+                    errors.writerow([report['lines'], 'malformed', text])
+                    report['malformed'] += 1
+                    continue
+                batch.append((report['lines'], text, row))
+                if len(batch) >= batch_size:
+                    insert_batch(conn, cur, batch, errors, report)
+                    batch = []
+            if batch:
+                insert_batch(conn, cur, batch, errors, report)
+        cur.close()
+    finally:
+        conn.close()
+    report['seconds'] = time.perf_counter() - began
+    return report
+
+
+def merge_errors(shard_reports, error_paths, out_path):
+    """Concatenate the shard error files in file order with absolute line numbers"""
+    line_base = 1 # header
+    with open(out_path, 'w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(['line', 'reason', 'row'])
+        for report, path in zip(shard_reports, error_paths):
+            if os.path.exists(path):
+                with open(path, newline='') as f:
+                    for local_line, reason, text in csv.reader(f):
+                        writer.writerow([line_base + int(local_line), reason, text])
+                os.remove(path)
+            line_base += report.get('lines', 0)
+
+
+def parallel_import_csv(filename, workers=None, batch_size=BATCH_SIZE):
+    """Load a CSV with `workers` processes, returns the merged report"""
+    workers = workers or os.cpu_count() or 1
+    try:
+        start = time.perf_counter()
+        shards = find_shards(filename, workers)
+        error_paths = [f"{filename}.shard{n}.errors.csv" for n in range(len(shards))]
+        shard_reports = []
+        with ProcessPoolExecutor(max_workers=max(1, len(shards))) as executor:
+            futures = [executor.submit(load_shard, filename, n, begin, end, error_paths[n], batch_size)
+                       for n, (begin, end) in enumerate(shards)]
+            for n, future in enumerate(futures):
+                try:
+                    shard_reports.append(future.result())
+                except (Exception, psycopg2.DatabaseError) as error:
+                    # committed batches of this shard stay, its error file is kept
+                    shard_reports.append({'shard': n, 'error': str(error)})
+        elapsed = time.perf_counter() - start
+
+        failed = [r for r in shard_reports if 'error' in r]
+        errors_path = f"{filename}.errors.csv"
+        if failed:
+            # line numbers of later shards are unknown, leave the shard files as they are
+            errors_path = None
+        else:
+            merge_errors(shard_reports, error_paths, errors_path)
+
+        lines = sum(r.get('lines', 0) for r in shard_reports)
+        report = {
+            'workers': len(shards),
+            'loaded': sum(r.get('loaded', 0) for r in shard_reports),
+            'duplicates': sum(r.get('duplicates', 0) for r in shard_reports),
+            'malformed': sum(r.get('malformed', 0) for r in shard_reports),
+            'failed_shards': [r['shard'] for r in failed],
+            'errors_file': errors_path,
+            'seconds': elapsed,
+            'rows_per_sec': lines / elapsed if elapsed else 0.0,
+            'shards': shard_reports,
+        }
+        print(f"Loaded: {report['loaded']}  Rejected: {report['duplicates']} duplicate, "
+              f"{report['malformed']} malformed")
+        print(f"Time: {elapsed:.2f}s ({report['rows_per_sec']:.0f} rows/s, {report['workers']} workers)")
+        for r in failed:
+            print(f"Shard {r['shard']} failed: {r['error']}")
+        if errors_path:
+            print(f"Rejected rows written to {errors_path}")
+        return report
+    except FileNotFoundError:
+        print("File not found")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load a contacts CSV with several processes")
+    parser.add_argument('filename')
+    parser.add_argument('--workers', type=int, default=None, help="default: CPU count")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    parallel_import_csv(args.filename, args.workers, args.batch_size)
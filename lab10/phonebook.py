@@ -1,11 +1,22 @@
 import psycopg2
+import atexit
 import csv
-from config import config
+import gzip
+import io
+import os
+import sys
+import time
+from db_pool import get_connection, pool_stats, register_statement, execute_prepared
+from migrate import migrate
+from instrumentation import instrumented, print_summary
+from batch_mode import parse_args, run_batch
+from dedupe import dedupe_csv
+from parallel_import import parallel_import_csv
 
 # 1. Connect and Create Table
-def create_tables():
-    """ Create table in the PostgreSQL database"""
-    commands = (
+# Schema history, applied once each by migrate.py and recorded in schema_migrations
+MIGRATIONS = [
+    {'version': 1, 'name': 'phonebook table', 'steps': [
         """
         CREATE TABLE IF NOT EXISTS phonebook (
             id SERIAL PRIMARY KEY,
@@ -14,150 +25,487 @@ def create_tables():
             phone VARCHAR(50) NOT NULL UNIQUE
         )
         """,
-    )
-    conn = None
+    ]},
+    {'version': 2, 'name': 'phone_norm column and trigger', 'steps': [
+        # canonical phone: digits only, 8XXXXXXXXXX and 10-digit numbers as 7XXXXXXXXXX
+        """
+        CREATE OR REPLACE FUNCTION normalize_phone(raw TEXT) RETURNS TEXT AS $$
+            SELECT CASE
+                WHEN d = '' THEN NULL
+                WHEN length(d) = 11 AND left(d, 1) = '8' THEN '7' || substr(d, 2)
+                WHEN length(d) = 10 THEN '7' || d
+                ELSE d
+            END
+            FROM (SELECT regexp_replace(raw, '[^0-9]', '', 'g') AS d) digits
+        $$ LANGUAGE sql IMMUTABLE STRICT
+        """,
+        "ALTER TABLE phonebook ADD COLUMN IF NOT EXISTS phone_norm VARCHAR(50)",
+        """
+        CREATE OR REPLACE FUNCTION phonebook_set_phone_norm() RETURNS trigger AS $$
+        BEGIN
+            NEW.phone_norm := normalize_phone(NEW.phone);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS phonebook_phone_norm ON phonebook",
+        """
+        CREATE TRIGGER phonebook_phone_norm BEFORE INSERT OR UPDATE OF phone ON phonebook
+            FOR EACH ROW EXECUTE FUNCTION phonebook_set_phone_norm()
+        """,
+    ]},
+    # online: fill old rows in batches, then build the index without blocking writes
+    {'version': 3, 'name': 'phone_norm unique index', 'online': True, 'steps': [
+        lambda conn: backfill_phone_norm(),
+        lambda conn: check_phone_norm_conflicts(conn),
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS phonebook_phone_norm_key ON phonebook (phone_norm)",
+    ]},
+]
+
+@instrumented
+def create_tables():
+    """ Bring the phonebook schema in the PostgreSQL database up to date"""
     try:
-        # read the connection parameters
-        params = config()
-        # connect to the PostgreSQL server
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
-        # create table one by one
-        for command in commands:
-            cur.execute(command)
-        # close communication with the PostgreSQL database server
-        cur.close()
-        # commit the changes
-        conn.commit()
-        print("Table created successfully")
+        migrate(MIGRATIONS, 'phonebook')
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
-    finally:
-        if conn is not None:
-            conn.close()
+
+def backfill_phone_norm(batch_size=10000):
+    """Fill phone_norm for old rows in id order, one short transaction per batch"""
+    sql = """
+        UPDATE phonebook SET phone_norm = normalize_phone(phone)
+        WHERE id IN (
+            SELECT id FROM phonebook
+            WHERE phone_norm IS NULL AND id > %s
+            ORDER BY id
+            LIMIT %s
+        )
+        RETURNING id
+    """
+    total = 0
+    last_id = 0
+    with get_connection() as conn:
+        cur = conn.cursor()
+        while True:
+            cur.execute(sql, (last_id, batch_size))
+            ids = [row[0] for row in cur.fetchall()]
+            conn.commit()
+            if not ids:
+                break
+            total += len(ids)
+            last_id = max(ids)
+        cur.close()
+    print(f"Backfilled phone_norm for {total} rows")
+    return total
+
+def check_phone_norm_conflicts(conn):
+    """Refuse to index phone_norm while a number is stored in several formats"""
+    sql_conflicts = """
+        SELECT phone_norm, array_agg(phone ORDER BY id) FROM phonebook
+        WHERE phone_norm IS NOT NULL
+        GROUP BY phone_norm HAVING count(*) > 1
+        LIMIT 20
+    """
+    cur = conn.cursor()
+    cur.execute(sql_conflicts)
+    conflicts = cur.fetchall()
+    cur.close()
+    if conflicts:
+        lines = [f"  {phone_norm}: {', '.join(phones)}" for phone_norm, phones in conflicts]
+        raise Exception("Cannot index phone_norm, same number stored more than once:\n" + "\n".join(lines))
 
 # 2. Insert Data (Console & CSV)
+# hot statements are PREPAREd once per pooled connection and run by name
+INSERT_CONTACT = register_statement('insert_contact', """
+    INSERT INTO phonebook(first_name, last_name, phone)
+    VALUES($1, $2, $3) RETURNING id""")
+INSERT_CONTACT_SKIP = register_statement('insert_contact_skip', """
+    INSERT INTO phonebook(first_name, last_name, phone)
+    VALUES($1, $2, $3) ON CONFLICT DO NOTHING""")
+
+@instrumented
 def insert_console():
-    sql = """INSERT INTO phonebook(first_name, last_name, phone)
-             VALUES(%s, %s, %s) RETURNING id;"""
-    conn = None
     try:
         # User Input
         f_name = input("Enter First Name: ")
         l_name = input("Enter Last Name: ")
         phone = input("Enter Phone: ")
 
-        params = config()
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
-        cur.execute(sql, (f_name, l_name, phone))
-        item_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
+        with get_connection() as conn:
+            cur = conn.cursor()
+            execute_prepared(cur, INSERT_CONTACT, (f_name, l_name, phone))
+            item_id = cur.fetchone()[0]
+            conn.commit()
+            cur.close()
         print(f"Inserted item with ID: {item_id}")
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
-    finally:
-        if conn is not None:
-            conn.close()
 
+def valid_csv_row(row):
+    """first_name, last_name, phone that fit the table; anything else is malformed"""
+    if len(row) != 3:
+        return False
+    first_name, last_name, phone = (value.strip() for value in row)
+    return (0 < len(first_name) <= 255 and len(last_name) <= 255
+            and 0 < len(phone) <= 50)
+
+@instrumented
 def insert_from_csv(filename):
-    sql = "INSERT INTO phonebook(first_name, last_name, phone) VALUES(%s, %s, %s)"
-    conn = None
     try:
-        params = config()
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
-        
-        with open(filename, 'r') as f:
-            reader = csv.reader(f)
-            next(reader) # Skip header
-            for row in reader:
-                cur.execute(sql, (row[0], row[1], row[2]))
-            
-        conn.commit()
-        cur.close()
-        print("CSV Data Uploaded")
+        loaded = skipped = malformed = 0
+        with get_connection() as conn:
+            cur = conn.cursor()
+
+            with open(filename, 'r') as f:
+                reader = csv.reader(f)
+                next(reader) # Skip header
+                for row in reader:
+                    # a malformed row or a duplicate phone skips that row instead of aborting the whole file
+                    if not valid_csv_row(row):
+                        malformed += 1
+                        continue
+                    execute_prepared(cur, INSERT_CONTACT_SKIP, tuple(value.strip() for value in row))
+                    if cur.rowcount:
+                        loaded += 1
+                    else:
+                        skipped += 1
+
+            conn.commit()
+            cur.close()
+        print(f"CSV Data Uploaded: {loaded} rows, {skipped} duplicates and {malformed} malformed rows skipped")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+    except FileNotFoundError:
+        print("File not found")
+
+class CsvCopyStream:
+    """File-like object that feeds valid CSV rows to COPY FROM STDIN.
+
+    Rows are read lazily from the source file, so only one small buffer
+    is kept in memory. Malformed rows are counted and skipped, and each
+    valid row gets its line number so duplicates can be resolved in order.
+    """
+
+    def __init__(self, f):
+        self.reader = csv.reader(f)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator='\n')
+        self.pending = ''
+        self.rows = 0
+        self.malformed = 0
+        next(self.reader, None) # Skip header
+
+    def read(self, size=8192):
+        while len(self.pending) < size:
+            row = next(self.reader, None)
+            if row is None:
+                break
+            if not valid_csv_row(row):
+                self.malformed += 1
+                continue
+            self.rows += 1
+            self.writer.writerow([self.reader.line_num] + [value.strip() for value in row])
+            self.pending += self.buffer.getvalue()
+            self.buffer.seek(0)
+            self.buffer.truncate()
+        chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+@instrumented
+def bulk_import_csv(filename):
+    """Stream a CSV file into phonebook through COPY and a staging table"""
+    commands = (
+        """
+        CREATE TEMP TABLE phonebook_staging (
+            line_no BIGINT,
+            first_name VARCHAR(255),
+            last_name VARCHAR(255),
+            phone VARCHAR(50)
+        ) ON COMMIT DROP
+        """,
+    )
+    sql_copy = "COPY phonebook_staging (line_no, first_name, last_name, phone) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (last_name))"
+    # keep the first occurrence of every phone, skip rows hitting any unique key
+    # (the same number in another format conflicts on phone_norm)
+    sql_merge = """
+        INSERT INTO phonebook(first_name, last_name, phone)
+        SELECT first_name, last_name, phone FROM (
+            SELECT DISTINCT ON (phone) line_no, first_name, last_name, phone
+            FROM phonebook_staging
+            ORDER BY phone, line_no
+        ) s
+        ORDER BY line_no
+        ON CONFLICT DO NOTHING
+    """
+    try:
+        start = time.perf_counter()
+        with open(filename, 'r', newline='') as f, get_connection() as conn:
+            cur = conn.cursor()
+            for command in commands:
+                cur.execute(command)
+            stream = CsvCopyStream(f)
+            cur.copy_expert(sql_copy, stream)
+            cur.execute(sql_merge)
+            loaded = cur.rowcount
+            conn.commit()
+            cur.close()
+        elapsed = time.perf_counter() - start
+
+        report = {
+            'loaded': loaded,
+            'duplicates': stream.rows - loaded,
+            'malformed': stream.malformed,
+            'seconds': elapsed,
+            'rows_per_sec': (stream.rows + stream.malformed) / elapsed if elapsed else 0.0,
+        }
+        print(f"Loaded: {report['loaded']}  Rejected: {report['duplicates']} duplicate, "
+              f"{report['malformed']} malformed")
+        print(f"Time: {elapsed:.2f}s ({report['rows_per_sec']:.0f} rows/s)")
+        return report
+    except FileNotFoundError:
+        print("File not found")
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
+
+@instrumented
+def import_deduped(filename):
+    """Dedupe the file against itself and the table, then bulk load what is left"""
+    try:
+        report = dedupe_csv(filename)
     except FileNotFoundError:
         print("File not found")
-    finally:
-        if conn is not None:
-            conn.close()
+        return
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+        return
+    if report['kept']:
+        return bulk_import_csv(report['output'])
 
 # 3. Update Data
+UPDATE_NAME = register_statement('update_name',
+    "UPDATE phonebook SET first_name = $1 WHERE phone_norm = normalize_phone($2)")
+
+@instrumented
 def update_contact():
-    sql = "UPDATE phonebook SET first_name = %s WHERE phone = %s"
-    conn = None
     try:
         phone_key = input("Enter Phone of user to update: ")
         new_name = input("Enter New First Name: ")
-        
-        params = config()
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
-        cur.execute(sql, (new_name, phone_key))
-        updated_rows = cur.rowcount
-        conn.commit()
-        cur.close()
+
+        with get_connection() as conn:
+            cur = conn.cursor()
+            execute_prepared(cur, UPDATE_NAME, (new_name, phone_key))
+            updated_rows = cur.rowcount
+            conn.commit()
+            cur.close()
         print(f"Updated {updated_rows} rows")
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
-    finally:
-        if conn is not None:
-            conn.close()
 
 # 4. Query Data
-def get_contacts():
+def stream_contacts(itersize=2000):
+    """Yield rows from a server-side cursor, fetching itersize rows per round trip"""
     sql = "SELECT first_name, last_name, phone FROM phonebook"
-    conn = None
-    try:
-        params = config()
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
+    with get_connection() as conn:
+        # a named cursor keeps the result on the server
+        cur = conn.cursor(name='phonebook_stream')
+        cur.itersize = itersize
         cur.execute(sql)
-        rows = cur.fetchall()
+        for row in cur:
+            yield row
+        cur.close()
+        conn.commit()
+
+def write_rows(rows, chunk_size=1000):
+    """Print rows to sys.stdout in chunks of lines, returns how many were written"""
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(f"{row}\n")
+        if len(chunk) >= chunk_size:
+            sys.stdout.writelines(chunk)
+            count += len(chunk)
+            chunk = []
+    sys.stdout.writelines(chunk)
+    return count + len(chunk)
+
+@instrumented
+def get_contacts(itersize=2000):
+    try:
         print("\n--- PhoneBook ---")
-        for row in rows:
-            print(row)
+        count = write_rows(stream_contacts(itersize))
+        print(f"Total: {count}")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+
+# 4b. Phone lookup (index seek on phone_norm, any input format)
+FIND_BY_PHONE = register_statement('find_contact_by_phone', """
+    SELECT id, first_name, last_name, phone FROM phonebook
+    WHERE phone_norm = normalize_phone($1)""")
+
+def find_by_phone(phone):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        execute_prepared(cur, FIND_BY_PHONE, (phone,))
+        row = cur.fetchone()
         cur.close()
+        conn.commit()
+    return row
+
+@instrumented
+def find_contact():
+    try:
+        row = find_by_phone(input("Enter Phone: "))
+        print(row if row else "Not found")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+
+# 4c. Export (COPY TO STDOUT)
+def export_csv(filename, pattern=None, start_id=None, end_id=None, window=1000000, resume=False):
+    """Stream phonebook into a data.csv-format file, gzip-compressed for *.gz names.
+
+    Rows go out in id windows of `window` ids. After each window the last
+    exported id and file size are saved to <filename>.progress, so an
+    interrupted export can continue with resume=True.
+    """
+    compress = filename.endswith('.gz')
+    progress_path = filename + '.progress'
+    header = b"first_name,last_name,phone\n"
+    where = ""
+    if pattern:
+        where = " AND (first_name ILIKE %(p)s OR last_name ILIKE %(p)s OR phone ILIKE %(p)s)"
+
+    def write_chunk(copy_sql=None, data=None):
+        # every chunk is appended (as its own gzip member) and closed cleanly
+        with open(filename, 'ab') as raw:
+            out = gzip.GzipFile(fileobj=raw, mode='wb') if compress else raw
+            if copy_sql is not None:
+                cur.copy_expert(copy_sql, out)
+            else:
+                out.write(data)
+            if compress:
+                out.close()
+            return raw.tell()
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT min(id), max(id) FROM phonebook")
+        min_id, max_id = cur.fetchone()
+        conn.commit()
+        last_id = (start_id - 1) if start_id is not None else (min_id or 1) - 1
+        if end_id is not None and max_id is not None:
+            max_id = min(max_id, end_id)
+
+        if resume and os.path.exists(progress_path):
+            with open(progress_path) as f:
+                last_id, offset = (int(value) for value in f.read().split())
+            # drop anything written after the last completed window
+            with open(filename, 'r+b') as raw:
+                raw.truncate(offset)
+        else:
+            open(filename, 'wb').close()
+            write_chunk(data=header)
+
+        exported = 0
+        while max_id is not None and last_id < max_id:
+            upper = min(last_id + window, max_id)
+            query = cur.mogrify(
+                "COPY (SELECT first_name, last_name, phone FROM phonebook"
+                " WHERE id > %(lo)s AND id <= %(hi)s" + where +
+                " ORDER BY id) TO STDOUT WITH (FORMAT csv)",
+                {'lo': last_id, 'hi': upper, 'p': f"%{pattern}%"}).decode()
+            offset = write_chunk(copy_sql=query)
+            exported += cur.rowcount
+            conn.commit()
+            last_id = upper
+            with open(progress_path, 'w') as f:
+                f.write(f"{last_id} {offset}")
+        cur.close()
+
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    print(f"Exported {exported} rows to {filename}")
+    return exported
+
+@instrumented
+def export_contacts():
+    try:
+        filename = input("Export to (.csv or .csv.gz): ")
+        pattern = input("Only names/phones containing (empty = all): ") or None
+        resume = input("Resume previous export? (y/N): ").lower() == 'y'
+        export_csv(filename, pattern=pattern, resume=resume)
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
-    finally:
-        if conn is not None:
-            conn.close()
 
 # 5. Delete Data
+DELETE_BY_PHONE = register_statement('delete_by_phone',
+    "DELETE FROM phonebook WHERE phone_norm = normalize_phone($1)")
+
+@instrumented
 def delete_contact():
-    sql = "DELETE FROM phonebook WHERE phone = %s"
-    conn = None
     try:
         phone_key = input("Enter Phone to delete: ")
-        params = config()
-        conn = psycopg2.connect(**params)
-        cur = conn.cursor()
-        cur.execute(sql, (phone_key,))
-        deleted_rows = cur.rowcount
-        conn.commit()
-        cur.close()
+        with get_connection() as conn:
+            cur = conn.cursor()
+            execute_prepared(cur, DELETE_BY_PHONE, (phone_key,))
+            deleted_rows = cur.rowcount
+            conn.commit()
+            cur.close()
         print(f"Deleted {deleted_rows} rows")
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
-    finally:
-        if conn is not None:
-            conn.close()
+
+# 6. Connection pool counters
+def show_pool_stats():
+    stats = pool_stats()
+    if stats is None:
+        print("Pool not started yet")
+        return
+    print("\n--- Connection Pool ---")
+    print(f"Open: {stats['size']} (idle {stats['idle']})")
+    print(f"Hits: {stats['hits']}  Misses: {stats['misses']}  Hit ratio: {stats['hit_ratio']:.2%}")
+    print(f"Waits: {stats['waits']}  Wait time: {stats['wait_time']:.3f}s  Timeouts: {stats['timeouts']}")
+    print(f"Discarded: {stats['discarded']}")
+
+# 7. Batch mode: handler(cur, command) per op, see batch_mode.py
+BATCH_OPS = {
+    'add': lambda cur, c: execute_prepared(cur, INSERT_CONTACT_SKIP, (c['first_name'], c.get('last_name', ''), c['phone'])),
+    'update': lambda cur, c: execute_prepared(cur, UPDATE_NAME, (c['first_name'], c['phone'])),
+    'delete': lambda cur, c: execute_prepared(cur, DELETE_BY_PHONE, (c['phone'],)),
+    'search': lambda cur, c: execute_prepared(cur, FIND_BY_PHONE, (c['phone'],)),
+}
 
 if __name__ == '__main__':
+    # --stats prints the latency summary on exit
+    if '--stats' in sys.argv:
+        atexit.register(print_summary)
     create_tables()
+    # python phonebook.py --batch commands.jsonl [--results FILE] [--group-size N]
+    if '--batch' in sys.argv:
+        args = parse_args(sys.argv[1:])
+        run_batch(args.batch, BATCH_OPS, args.results, args.group_size)
+        sys.exit()
     while True:
-        print("\n1. Add (Console)\n2. Add (CSV)\n3. Update Name\n4. Show All\n5. Delete\n6. Exit")
+        print("\n1. Add (Console)\n2. Add (CSV)\n3. Update Name\n4. Show All\n5. Delete\n6. Pool Stats\n7. Add (CSV, bulk COPY)\n8. Find by Phone\n9. Export (CSV)\n10. Add (CSV, parallel)\n11. Latency Stats\n12. Add (CSV, dedupe first)\n13. Exit")
         choice = input("Choice: ")
         if choice == '1': insert_console()
-        elif choice == '2': 
+        elif choice == '2':
             f = input("Filename: ")
             insert_from_csv(f)
         elif choice == '3': update_contact()
         elif choice == '4': get_contacts()
         elif choice == '5': delete_contact()
-        elif choice == '6': break
\ No newline at end of file
+        elif choice == '6': show_pool_stats()
+        elif choice == '7':
+            f = input("Filename: ")
+            bulk_import_csv(f)
+        elif choice == '8': find_contact()
+        elif choice == '9': export_contacts()
+        elif choice == '10':
+            f = input("Filename: ")
+            workers = input("Workers (empty = CPU count): ")
+            parallel_import_csv(f, int(workers) if workers else None)
+        elif choice == '11': print_summary()
+        elif choice == '12':
+            f = input("Filename: ")
+            import_deduped(f)
+        elif choice == '13': break
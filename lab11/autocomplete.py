@@ -0,0 +1,353 @@
+import bisect
+import heapq
+import threading
+import time
+
+import psycopg2
+from change_listener import get_listener
+from config import config
+from db_pool import get_connection
+
+# Characters that can appear in a typed phone number
+PHONE_CHARS = set('0123456789+-() ')
+# Contact ids re-read per query when applying a change
+FETCH_BATCH = 5000
+# Changes applied in place; larger batches are merged into new arrays
+SMALL_BATCH = 64
+# A batch touching more than this share of the index triggers a rebuild instead
+REBUILD_FRACTION = 0.05
+
+
+def phone_key(phone):
+    return ''.join(ch for ch in phone or '' if '0' <= ch <= '9')
+
+
+def row_keys(row):
+    """Index keys of a (first_name, last_name, phone) row"""
+    first_name, last_name, phone = row
+    keys = [(first_name or '').lower(), (last_name or '').lower(), phone_key(phone)]
+    return [key for key in dict.fromkeys(keys) if key]
+
+
+def query_key(prefix):
+    """Typed prefix -> index key: phone-like input is matched on its digits"""
+    prefix = prefix.strip()
+    if prefix and set(prefix) <= PHONE_CHARS:
+        return phone_key(prefix)
+    return prefix.lower()
+
+
+class PrefixIndex:
+    """Sorted key array searched with bisect, for per-keystroke completion.
+
+    Every contact is stored under its lower-cased first name, last name and
+    phone digits; the three entries share one row tuple. The change listener
+    only queues notifications; a worker thread drains the queue and applies
+    each batch by contact id (large statements: ids from phonebook_changes)
+    in one merge pass over the arrays. A flush (TRUNCATE, listener
+    reconnect) or a batch touching a large share of the index rebuilds it
+    from a streaming read and swaps it in at the end.
+    """
+
+    def __init__(self, max_rows=1000000, itersize=5000):
+        self.max_rows = max_rows
+        self.itersize = itersize
+        self.ready = False
+        self._keys = []
+        self._rows = []
+        self._by_id = {}
+        # _lock guards reads against swaps; _write_lock serialises builds and batches
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._queue = []
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._stats = {'builds': 0, 'build_seconds': 0.0, 'updates': 0, 'rows_changed': 0}
+
+    # --- building ---
+    def _load(self):
+        entries = []
+        by_id = {}
+        with get_connection() as conn:
+            # planner statistics (reltuples): a table clearly over the limit is not streamed at all
+            cur = conn.cursor()
+            cur.execute("SELECT estimate_phonebook_count()")
+            estimate = cur.fetchone()[0]
+            cur.close()
+            if estimate is not None and estimate > self.max_rows * 1.1:
+                conn.commit()
+                return None, {}
+            cur = conn.cursor(name='autocomplete_load')
+            cur.itersize = self.itersize
+            cur.execute("SELECT id, first_name, last_name, phone FROM phonebook")
+            for count, (contact_id, *row) in enumerate(cur, 1):
+                if count > self.max_rows:
+                    entries = None
+                    break
+                row = tuple(row)
+                by_id[contact_id] = row
+                entries.extend((key, row) for key in row_keys(row))
+            cur.close()
+            conn.commit()
+        if entries is None:
+            return None, {}
+        entries.sort(key=lambda entry: entry[0])
+        return entries, by_id
+
+    def build(self):
+        """(Re)load the index from the table; too many rows leaves it disabled"""
+        with self._write_lock:
+            self._build()
+
+    def _build(self):
+        start = time.perf_counter()
+        try:
+            entries, by_id = self._load()
+        except Exception:
+            with self._lock:
+                self.ready = False
+            raise
+        with self._lock:
+            if entries is None:
+                self.ready = False
+                self._keys, self._rows, self._by_id = [], [], {}
+            else:
+                self._keys = [key for key, _ in entries]
+                self._rows = [row for _, row in entries]
+                self._by_id = by_id
+                self.ready = True
+            self._stats['builds'] += 1
+            self._stats['build_seconds'] = time.perf_counter() - start
+
+    # --- incremental updates ---
+    def handle_change(self, payload):
+        """Change listener handler: queue the notification and return at once"""
+        with self._lock:
+            self._queue.append(payload)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._apply_loop, name='autocomplete-apply',
+                                                daemon=True)
+                self._worker.start()
+        self._wakeup.set()
+
+    def _apply_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                batch, self._queue = self._queue, []
+            if not batch:
+                continue
+            try:
+                with self._write_lock:
+                    self._apply_batch(batch)
+            except (Exception, psycopg2.DatabaseError) as error:
+                print(f"Autocomplete update failed, rebuilding: {error}")
+                try:
+                    self.build()
+                except (Exception, psycopg2.DatabaseError) as error:
+                    print(f"Autocomplete index not built: {error}")
+
+    def _apply_batch(self, batch):
+        """Fold queued notifications into {contact_id: row or None} and apply them"""
+        if any(payload.get('op') == 'flush' or
+               (payload.get('ids') is None and payload.get('txid') is None) for payload in batch):
+            self._build()
+            return
+        if not self.ready:
+            return
+        changes = {}
+        refresh = set()
+        for payload in batch:
+            op = payload.get('op')
+            if payload.get('txid') is not None:
+                # too many rows for the notification: that transaction's ids are re-read
+                ids = self._changed_ids(payload['txid'])
+            elif op == 'INSERT':
+                for contact_id, row in zip(payload['ids'], payload['rows']):
+                    changes[contact_id] = tuple(row)
+                    refresh.discard(contact_id)
+                continue
+            elif op == 'DELETE':
+                for contact_id in payload['ids']:
+                    changes[contact_id] = None
+                    refresh.discard(contact_id)
+                continue
+            else:
+                # UPDATE sends old and new rows mixed: re-read the contacts by id
+                ids = payload['ids']
+            refresh.update(ids)
+        if len(changes) + len(refresh) > max(SMALL_BATCH, REBUILD_FRACTION * len(self._by_id)):
+            # re-reading that many rows by id costs more than one sequential load
+            self._build()
+            return
+        if refresh:
+            current = self._current_rows(refresh)
+            for contact_id in refresh:
+                changes[contact_id] = current.get(contact_id)
+        self._apply(changes)
+        with self._lock:
+            self._stats['updates'] += 1
+
+    def _find(self, key, row):
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_right(self._keys, key, lo)
+        for i in range(lo, hi):
+            if self._rows[i] == row:
+                return i
+        return None
+
+    def _apply(self, changes):
+        """Store each contact's new row (None: deleted).
+
+        A few rows are inserted in place; larger batches are merged into new
+        arrays in O(n + m log m) and swapped in, instead of one O(n) list
+        insert per key.
+        """
+        drop = set()
+        fresh = []
+        updates = {}
+        for contact_id, row in changes.items():
+            old = self._by_id.get(contact_id)
+            if old == row:
+                continue
+            if old is not None:
+                drop.update((key, old) for key in row_keys(old))
+            if row is not None:
+                fresh.extend((key, row) for key in row_keys(row))
+            updates[contact_id] = row
+        if not updates:
+            return
+
+        if len(updates) <= SMALL_BATCH:
+            with self._lock:
+                for key, row in drop:
+                    i = self._find(key, row)
+                    if i is not None:
+                        del self._keys[i]
+                        del self._rows[i]
+                for key, row in fresh:
+                    i = bisect.bisect_right(self._keys, key)
+                    self._keys.insert(i, key)
+                    self._rows.insert(i, row)
+                self._update_ids(self._by_id, updates)
+        else:
+            # only this thread (under _write_lock) changes the arrays, so they are read without _lock
+            fresh.sort(key=lambda entry: entry[0])
+            kept = ((key, row) for key, row in zip(self._keys, self._rows) if (key, row) not in drop)
+            merged = list(heapq.merge(kept, fresh, key=lambda entry: entry[0]))
+            by_id = dict(self._by_id)
+            self._update_ids(by_id, updates)
+            keys = [key for key, _ in merged]
+            rows = [row for _, row in merged]
+            with self._lock:
+                self._keys, self._rows, self._by_id = keys, rows, by_id
+        with self._lock:
+            self._stats['rows_changed'] += len(updates)
+
+    @staticmethod
+    def _update_ids(by_id, updates):
+        for contact_id, row in updates.items():
+            if row is None:
+                by_id.pop(contact_id, None)
+            else:
+                by_id[contact_id] = row
+
+    def _changed_ids(self, txid):
+        """Contact ids a large transaction touched, from the change log"""
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""SELECT DISTINCT contact_id FROM phonebook_changes
+                           WHERE txid = %s AND contact_id IS NOT NULL""", (txid,))
+            ids = [row[0] for row in cur.fetchall()]
+            cur.close()
+            conn.commit()
+        return ids
+
+    def _current_rows(self, ids):
+        """id -> (first_name, last_name, phone) for the ids that still exist"""
+        ids = list(ids)
+        current = {}
+        with get_connection() as conn:
+            cur = conn.cursor()
+            for i in range(0, len(ids), FETCH_BATCH):
+                cur.execute("SELECT id, first_name, last_name, phone FROM phonebook WHERE id = ANY(%s)",
+                            (ids[i:i + FETCH_BATCH],))
+                current.update((contact_id, tuple(row)) for contact_id, *row in cur.fetchall())
+            cur.close()
+            conn.commit()
+        return current
+
+    # --- lookups ---
+    def complete(self, prefix, k=10):
+        """Top-k contacts whose first name, last name or phone starts with prefix"""
+        key = query_key(prefix)
+        if not key:
+            return []
+        found = []
+        with self._lock:
+            i = bisect.bisect_left(self._keys, key)
+            while i < len(self._keys) and len(found) < k and self._keys[i].startswith(key):
+                row = self._rows[i]
+                if row not in found:
+                    found.append(row)
+                i += 1
+        return found
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['entries'] = len(self._keys)
+            snapshot['ready'] = self.ready
+        return snapshot
+
+
+def complete_from_db(prefix, k=10):
+    """Fallback when the index is disabled: prefix match on the server.
+
+    Each condition matches a text_pattern_ops expression index (lab11 migration 9).
+    """
+    key = query_key(prefix)
+    if not key:
+        return []
+    like = key.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    sql = """SELECT first_name, last_name, phone FROM phonebook
+             WHERE lower(first_name) LIKE %s OR lower(last_name) LIKE %s
+                OR regexp_replace(phone, '[^0-9]', '', 'g') LIKE %s
+             ORDER BY first_name, last_name LIMIT %s"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, (like, like, like, k))
+        rows = cur.fetchall()
+        cur.close()
+        conn.commit()
+    return rows
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_autocomplete():
+    """Return the process-wide index, built and subscribed to changes on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            try:
+                settings = config(section='autocomplete')
+            except Exception:
+                settings = {}
+            _index = PrefixIndex(max_rows=int(settings.get('max_rows', 1000000)))
+            get_listener().add_handler(_index.handle_change)
+            try:
+                _index.build()
+            except (Exception, psycopg2.DatabaseError) as error:
+                print(f"Autocomplete index not built: {error}")
+    return _index
+
+
+def complete(prefix, k=10):
+    index = get_autocomplete()
+    if index.ready:
+        return index.complete(prefix, k)
+    return complete_from_db(prefix, k)
@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import random
+import time
+
+import psycopg2
+from config import config
+import phonebook_async
+
+
+def sample_patterns(count):
+    """Lookup patterns taken from the stored contacts"""
+    conn = psycopg2.connect(**config())
+    cur = conn.cursor()
+    cur.execute("SELECT first_name, last_name, phone FROM phonebook ORDER BY random() LIMIT 1000")
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    if not rows:
+        raise SystemExit("phonebook is empty, load some contacts first")
+    values = [value for row in rows for value in row if value]
+    return [random.choice(values) for _ in range(count)]
+
+
+def bench_sync(patterns):
+    conn = psycopg2.connect(**config())
+    cur = conn.cursor()
+    start = time.perf_counter()
+    for pattern in patterns:
+        cur.execute("SELECT * FROM get_users_by_pattern(%s);", (pattern,))
+        cur.fetchall()
+    elapsed = time.perf_counter() - start
+    cur.close()
+    conn.close()
+    return elapsed
+
+
+async def bench_async(patterns, pool_size, concurrency):
+    pool = await phonebook_async.create_pool(min_size=pool_size, max_size=pool_size)
+    try:
+        start = time.perf_counter()
+        await phonebook_async.search_many(pool, patterns, concurrency)
+        return time.perf_counter() - start
+    finally:
+        await pool.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Lookups/s: sync psycopg2 vs asyncpg pool")
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--pool-size', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=200)
+    args = parser.parse_args()
+
+    patterns = sample_patterns(args.requests)
+    sync_time = bench_sync(patterns)
+    async_time = asyncio.run(bench_async(patterns, args.pool_size, args.concurrency))
+
+    print(f"{args.requests} lookups")
+    print(f"sync  (1 connection):         {args.requests / sync_time:8.0f} req/s")
+    print(f"async (pool {args.pool_size}, {args.concurrency} in flight): "
+          f"{args.requests / async_time:8.0f} req/s")
+    print(f"speedup: {sync_time / async_time:.1f}x")
@@ -0,0 +1,99 @@
+import argparse
+import json
+import random
+import time
+
+import psycopg2
+from config import config
+from db_pool import PreparedConnection, execute_prepared
+from benchmark import summarize
+import phonebook
+
+# (registered statement, same query as plain SQL, argument builder)
+CASES = [
+    (phonebook.SEARCH_PATTERN, "SELECT * FROM get_users_by_pattern(%s)",
+     lambda rng, rows: (rng.choice(rng.choice(rows)[1:3]) or rows[0][1],)),
+    (phonebook.SEARCH_RANKED, "SELECT * FROM search_users_ranked(%s, %s)",
+     lambda rng, rows: (rng.choice(rows)[2] or rows[0][1], 50)),
+    (phonebook.FIND_BY_PHONE, "SELECT * FROM get_user_by_phone(%s)",
+     lambda rng, rows: (rng.choice(rows)[3],)),
+    (phonebook.PAGINATED, "SELECT * FROM get_users_paginated(%s, %s)",
+     lambda rng, rows: (50, rng.randrange(len(rows)))),
+    (phonebook.KEYSET_PAGE, "SELECT * FROM get_users_keyset(%s, %s, %s, %s, %s)",
+     lambda rng, rows: ('first_name', *rng.choice([(r[1], r[0]) for r in rows]), 50, False)),
+]
+
+
+def sample_rows(cur, count=1000):
+    cur.execute("SELECT id, first_name, last_name, phone FROM phonebook ORDER BY random() LIMIT %s", (count,))
+    rows = cur.fetchall()
+    if not rows:
+        raise SystemExit("phonebook is empty, load some contacts first")
+    return rows
+
+
+def planning_ms(cur, sql, args):
+    """Planning Time reported by EXPLAIN ANALYZE for one call"""
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, args)
+    return cur.fetchone()[0][0]['Planning Time']
+
+
+def bench_case(plain_cur, prep_cur, name, sql, args_list):
+    plain, prepared = [], []
+    for args in args_list:
+        start = time.perf_counter()
+        plain_cur.execute(sql, args)
+        plain_cur.fetchall()
+        plain.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        execute_prepared(prep_cur, name, args)
+        prep_cur.fetchall()
+        prepared.append(time.perf_counter() - start)
+
+    # the server's own view: time spent planning per call
+    plan_sql = f"EXECUTE {name} ({', '.join(['%s'] * len(args_list[0]))})"
+    plain_plan = [planning_ms(plain_cur, sql, args) for args in args_list]
+    prepared_plan = [planning_ms(prep_cur, plan_sql, args) for args in args_list]
+    return {
+        'plain': summarize(plain),
+        'prepared': summarize(prepared),
+        'plain_planning_ms': sum(plain_plan) / len(plain_plan),
+        'prepared_planning_ms': sum(prepared_plan) / len(prepared_plan),
+    }
+
+
+def run_benchmark(samples, seed):
+    rng = random.Random(seed)
+    plain_conn = psycopg2.connect(**config())
+    prep_conn = psycopg2.connect(connection_factory=PreparedConnection, **config())
+    # read-only statements, nothing to commit
+    plain_conn.autocommit = prep_conn.autocommit = True
+    try:
+        plain_cur, prep_cur = plain_conn.cursor(), prep_conn.cursor()
+        rows = sample_rows(plain_cur)
+        report = {}
+        for name, sql, make_args in CASES:
+            args_list = [make_args(rng, rows) for _ in range(samples)]
+            report[name] = bench_case(plain_cur, prep_cur, name, sql, args_list)
+        return report
+    finally:
+        plain_conn.close()
+        prep_conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plain vs prepared execution of the lab11 functions")
+    parser.add_argument('--samples', type=int, default=500, help="calls per statement")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help="optional JSON report path")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.samples, args.seed)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    print(f"{'statement':15} {'plain p50':>10} {'prep p50':>10} {'plan plain':>11} {'plan prep':>10}")
+    for name, stats in report.items():
+        print(f"{name:15} {stats['plain']['p50_ms']:8.3f}ms {stats['prepared']['p50_ms']:8.3f}ms "
+              f"{stats['plain_planning_ms']:9.3f}ms {stats['prepared_planning_ms']:8.3f}ms")
@@ -0,0 +1,279 @@
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import psycopg2
+from config import config
+from gen_contacts import contact_name, contact_phone, generate_contacts
+import phonebook
+
+LAB10_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lab10')
+
+
+class ThrowawayPostgres:
+    """Private PostgreSQL cluster in a temp dir, torn down on exit.
+
+    Connection settings are handed to config() through PHONEBOOK_POSTGRESQL_*
+    environment overrides, so every phonebook function talks to it.
+    """
+
+    def __init__(self, bindir=None, database='phonebook_bench'):
+        self.bindir = bindir or self._find_bindir()
+        self.database = database
+        self.tmpdir = None
+        self.port = None
+
+    def _find_bindir(self):
+        initdb = shutil.which('initdb')
+        if initdb:
+            return os.path.dirname(initdb)
+        try:
+            out = subprocess.run(['pg_config', '--bindir'], capture_output=True, text=True, check=True)
+            return out.stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            raise SystemExit("PostgreSQL binaries not found, pass --pg-bindir")
+
+    def _run(self, *args):
+        subprocess.run([os.path.join(self.bindir, args[0])] + list(args[1:]),
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+    def __enter__(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='phonebook_bench_')
+        data = os.path.join(self.tmpdir, 'data')
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+
+        self._run('initdb', '-D', data, '-U', 'postgres', '--auth=trust', '-E', 'UTF8')
+        self._run('pg_ctl', '-D', data, '-w', '-l', os.path.join(self.tmpdir, 'server.log'),
+                  '-o', f"-p {self.port} -k {self.tmpdir} -c listen_addresses=''", 'start')
+
+        os.environ.update({
+            'PHONEBOOK_POSTGRESQL_HOST': self.tmpdir,
+            'PHONEBOOK_POSTGRESQL_PORT': str(self.port),
+            'PHONEBOOK_POSTGRESQL_USER': 'postgres',
+            'PHONEBOOK_POSTGRESQL_PASSWORD': '',
+            'PHONEBOOK_POSTGRESQL_DATABASE': 'postgres',
+        })
+        conn = psycopg2.connect(**config())
+        conn.autocommit = True
+        conn.cursor().execute(f"CREATE DATABASE {self.database}")
+        conn.close()
+        os.environ['PHONEBOOK_POSTGRESQL_DATABASE'] = self.database
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self._run('pg_ctl', '-D', os.path.join(self.tmpdir, 'data'), '-m', 'fast', 'stop')
+        finally:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+            for key in [k for k in os.environ if k.startswith('PHONEBOOK_POSTGRESQL_')]:
+                del os.environ[key]
+
+
+# Runs one lab10/phonebook.py function; the last line of output is its timing
+LAB10_CALL = """
+import json, sys, time
+import phonebook
+start = time.perf_counter()
+getattr(phonebook, sys.argv[1])(*sys.argv[2:])
+print(json.dumps({'seconds': time.perf_counter() - start}))
+"""
+
+
+def run_lab10(func, *args):
+    """Call lab10's phonebook.func in a child process started in lab10/.
+
+    lab10 has its own config, db_pool and migrate modules under the same
+    names as lab11's; in this process they would resolve to lab11's. The
+    PHONEBOOK_POSTGRESQL_* overrides are inherited, so the child uses the
+    same server. Returns the seconds the call took inside the child.
+    """
+    out = subprocess.run([sys.executable, '-c', LAB10_CALL, func, *args], cwd=LAB10_DIR,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])['seconds']
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    # nearest-rank percentile
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def summarize(latencies, rows=None, elapsed=None):
+    latencies = sorted(latencies)
+    elapsed = elapsed if elapsed is not None else sum(latencies)
+    summary = {
+        'count': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'ops_per_sec': len(latencies) / elapsed if elapsed else None,
+    }
+    if rows is not None:
+        summary['rows'] = rows
+        summary['rows_per_sec'] = rows / elapsed if elapsed else None
+    return summary
+
+
+def timed_calls(cur, sql, args_list, commit_conn=None):
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        cur.execute(sql, args)
+        if cur.description is not None:
+            cur.fetchall()
+        if commit_conn is not None:
+            commit_conn.commit()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def count_rows(cur):
+    cur.execute("SELECT count(*) FROM phonebook")
+    return cur.fetchone()[0]
+
+
+def check_loaded(name, loaded, counts):
+    """A failed import must not end up in the report as a fast one"""
+    if loaded != counts['loadable']:
+        raise RuntimeError(f"{name} stored {loaded} rows, the data set has {counts['loadable']} loadable "
+                           f"({counts['duplicate_phone']} duplicate phones, {counts['malformed']} malformed rows)")
+
+
+def reset_table(conn):
+    cur = conn.cursor()
+    cur.execute("TRUNCATE phonebook RESTART IDENTITY")
+    conn.commit()
+    cur.close()
+
+
+def run_benchmark(rows, duplicate_rate, invalid_rate, samples, batch_size, row_import_limit, seed):
+    rng = random.Random(seed)
+    report = {
+        'dataset': {'rows': rows, 'duplicate_rate': duplicate_rate,
+                    'invalid_rate': invalid_rate, 'seed': seed},
+        'samples': samples,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'operations': {},
+    }
+    ops = report['operations']
+
+    workdir = tempfile.mkdtemp(prefix='phonebook_data_')
+    csv_path = os.path.join(workdir, 'data.csv')
+    try:
+        report['dataset']['counts'] = generate_contacts(csv_path, rows, duplicate_rate, invalid_rate, seed)
+
+        run_lab10('create_tables')
+        phonebook.init_db_functions()
+
+        conn = psycopg2.connect(**config())
+        cur = conn.cursor()
+        cur.execute("SHOW server_version")
+        report['server_version'] = cur.fetchone()[0]
+        conn.commit()
+
+        # 1. row-by-row insert_from_csv (skipped for very large files)
+        if rows <= row_import_limit:
+            reset_table(conn)
+            elapsed = run_lab10('insert_from_csv', csv_path)
+            loaded = count_rows(cur)
+            check_loaded('insert_from_csv', loaded, report['dataset']['counts'])
+            ops['insert_from_csv'] = summarize([elapsed], rows=loaded, elapsed=elapsed)
+            conn.commit()
+
+        # 2. COPY bulk import, also the data set for the remaining operations
+        reset_table(conn)
+        elapsed = run_lab10('bulk_import_csv', csv_path)
+        loaded = count_rows(cur)
+        check_loaded('bulk_import_csv', loaded, report['dataset']['counts'])
+        ops['bulk_import_csv'] = summarize([elapsed], rows=loaded, elapsed=elapsed)
+        cur.execute("ANALYZE phonebook")
+        conn.commit()
+
+        # 3. insert_many_users: batches of new contacts, ~1% invalid phones
+        args_list = []
+        for b in range(samples):
+            base = rows + b * batch_size
+            firsts, lasts, phones = [], [], []
+            for i in range(base, base + batch_size):
+                first, last = contact_name(i)
+                firsts.append(first)
+                lasts.append(last)
+                phones.append(contact_phone(i) if rng.random() > 0.01 else 'bad')
+            args_list.append((firsts, lasts, phones))
+        latencies = timed_calls(cur, "SELECT * FROM insert_many_users(%s, %s, %s);", args_list, conn)
+        ops['insert_many_users'] = summarize(latencies, rows=samples * batch_size)
+
+        # 4. get_users_by_pattern: name fragments and phone fragments
+        patterns = []
+        for _ in range(samples):
+            i = rng.randrange(rows)
+            first, last = contact_name(i)
+            patterns.append(rng.choice([first, last, last[:4], contact_phone(i)[-6:]]))
+        latencies = timed_calls(cur, "SELECT * FROM get_users_by_pattern(%s);", [(p,) for p in patterns], conn)
+        ops['get_users_by_pattern'] = summarize(latencies)
+
+        # 5. get_users_paginated: random pages over the whole table
+        page_size = 50
+        args_list = [(page_size, rng.randrange(max(1, loaded - page_size))) for _ in range(samples)]
+        latencies = timed_calls(cur, "SELECT * FROM get_users_paginated(%s, %s);", args_list, conn)
+        ops['get_users_paginated'] = summarize(latencies)
+
+        # 6. delete_user_proc by phone
+        args_list = [(contact_phone(rng.randrange(rows)),) for _ in range(samples)]
+        latencies = timed_calls(cur, "CALL delete_user_proc(%s);", args_list, conn)
+        ops['delete_user_proc'] = summarize(latencies)
+
+        cur.close()
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Phonebook benchmark against a throwaway PostgreSQL")
+    parser.add_argument('--rows', type=int, default=10000, help="data set size (10k .. 10M)")
+    parser.add_argument('--duplicate-rate', type=float, default=0.01)
+    parser.add_argument('--invalid-rate', type=float, default=0.01)
+    parser.add_argument('--samples', type=int, default=200, help="calls per measured operation")
+    parser.add_argument('--batch-size', type=int, default=1000, help="rows per insert_many_users call")
+    parser.add_argument('--row-import-limit', type=int, default=1000000,
+                        help="skip row-by-row insert_from_csv above this many rows")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--pg-bindir', help="directory with initdb/pg_ctl")
+    parser.add_argument('--use-configured-db', action='store_true',
+                        help="run against database.ini instead of a throwaway cluster (TRUNCATES phonebook)")
+    parser.add_argument('--out', help="JSON report path (default bench_<rows>.json)")
+    args = parser.parse_args()
+
+    def run():
+        return run_benchmark(args.rows, args.duplicate_rate, args.invalid_rate, args.samples,
+                             args.batch_size, args.row_import_limit, args.seed)
+
+    if args.use_configured_db:
+        report = run()
+    else:
+        with ThrowawayPostgres(args.pg_bindir):
+            report = run()
+
+    out = args.out or f"bench_{args.rows}.json"
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    for name, stats in report['operations'].items():
+        rate = f"{stats['rows_per_sec']:.0f} rows/s" if 'rows_per_sec' in stats else f"{stats['ops_per_sec']:.0f} ops/s"
+        print(f"{name:22} p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms  "
+              f"p99 {stats['p99_ms']:9.2f} ms  {rate}")
+    print(f"Report written to {out}")
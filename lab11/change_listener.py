@@ -0,0 +1,91 @@
+import json
+import select
+import threading
+
+import psycopg2
+import psycopg2.extensions
+from config import config
+
+# Channel used by the phonebook_notify_change() triggers
+CHANNEL = 'phonebook_changed'
+
+
+class ChangeListener(threading.Thread):
+    """Background LISTEN on the phonebook change channel.
+
+    Every notification is decoded and passed to the registered handlers:
+    {'op': 'INSERT'|'UPDATE'|'DELETE', 'rows': [[first, last, phone], ...], 'ids': [...]},
+    {'op': ..., 'txid': n} when the statement was too large to describe (its
+    contact ids are in phonebook_changes under that txid), or {'op': 'flush'}
+    when the table was truncated or notifications may have been missed (reconnect).
+    """
+
+    def __init__(self, channel=CHANNEL, poll_interval=5.0, retry_delay=2.0):
+        super().__init__(name='phonebook-listener', daemon=True)
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.handlers = []
+        self.connected = threading.Event()
+        self._stop_event = threading.Event()
+
+    def add_handler(self, handler):
+        self.handlers.append(handler)
+
+    def _dispatch(self, payload):
+        for handler in list(self.handlers):
+            try:
+                handler(payload)
+            except Exception as error:
+                print(f"Change handler error: {error}")
+
+    def _listen(self):
+        conn = psycopg2.connect(**config())
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {self.channel};")
+            # anything may have changed while nobody was listening
+            self._dispatch({'op': 'flush'})
+            self.connected.set()
+
+            while not self._stop_event.is_set():
+                if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        payload = json.loads(notify.payload)
+                    except ValueError:
+                        payload = {'op': 'flush'}
+                    self._dispatch(payload)
+        finally:
+            self.connected.clear()
+            conn.close()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+            except (Exception, psycopg2.DatabaseError) as error:
+                print(f"Change listener: {error}")
+                self._dispatch({'op': 'flush'})
+                self._stop_event.wait(self.retry_delay)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_listener():
+    """Return the process-wide listener, starting it on first use"""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = ChangeListener()
+            _listener.start()
+    return _listener
@@ -0,0 +1,70 @@
+import sys
+import psycopg2
+from config import config
+
+# Same predicate as search_users_ranked / get_users_by_pattern
+sql_search = """
+    SELECT p.id FROM {table} p
+    WHERE p.first_name ILIKE '%%' || %s || '%%'
+       OR p.last_name ILIKE '%%' || %s || '%%'
+       OR p.phone ILIKE '%%' || %s || '%%'
+"""
+
+sql_setup = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+DROP TABLE IF EXISTS phonebook_trgm_check;
+-- copy of phonebook including its trigram indexes, so real data is untouched
+CREATE TABLE phonebook_trgm_check (LIKE phonebook INCLUDING ALL);
+INSERT INTO phonebook_trgm_check (id, first_name, last_name, phone)
+SELECT g, 'Name' || g, 'Surname' || (g %% 50000), '8' || lpad(g::text, 10, '0')
+FROM generate_series(1, %s) g;
+ANALYZE phonebook_trgm_check;
+"""
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def check_trgm_index(rows=1000000, pattern='Surname4242'):
+    """Fill a scratch copy of phonebook and prove the search uses the GIN indexes"""
+    conn = None
+    try:
+        conn = psycopg2.connect(**config())
+        cur = conn.cursor()
+        print(f"Loading {rows} rows into phonebook_trgm_check...")
+        cur.execute(sql_setup, (rows,))
+        conn.commit()
+
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql_search.format(table='phonebook_trgm_check'),
+                    (pattern, pattern, pattern))
+        plan = cur.fetchone()[0][0]['Plan']
+        nodes = list(plan_nodes(plan))
+        used = sorted({n['Index Name'] for n in nodes
+                       if n['Node Type'] == 'Bitmap Index Scan' and 'trgm' in n['Index Name']})
+        seq_scans = [n for n in nodes if n['Node Type'] == 'Seq Scan']
+
+        print(f"Plan: {plan['Node Type']}, estimated rows {plan['Plan Rows']}")
+        print(f"Trigram indexes used: {', '.join(used) or 'none'}")
+
+        cur.execute("DROP TABLE phonebook_trgm_check")
+        conn.commit()
+        cur.close()
+        return bool(used) and not seq_scans
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+        return False
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    if check_trgm_index(rows):
+        print("OK: search is served by the trigram indexes")
+    else:
+        print("FAIL: search falls back to a sequential scan")
+        sys.exit(1)
@@ -1,18 +1,58 @@
+import os
+import threading
 from configparser import ConfigParser
+from types import MappingProxyType
 
-def config(filename='database.ini', section='postgresql'):
-    # create a parser
-    parser = ConfigParser()
-    # read config file
-    parser.read(filename)
-
-    # get section, default to postgresql
-    db = {}
-    if parser.has_section(section):
-        params = parser.items(section)
-        for param in params:
-            db[param[0]] = param[1]
-    else:
+# 'primary' is the historical [postgresql] section
+SECTION_ALIASES = {'primary': 'postgresql'}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _read_sections(filename):
+    """Parse the file once and re-read it only when its mtime changes"""
+    path = os.path.abspath(filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        # create a parser
+        parser = ConfigParser()
+        # read config file
+        parser.read(path)
+        sections = {name: dict(parser.items(name)) for name in parser.sections()}
+        _cache[path] = (mtime, sections)
+        return sections
+
+
+def _env_overrides(section):
+    # e.g. PHONEBOOK_POSTGRESQL_HOST=db.local or PHONEBOOK_REPLICA_PORT=5433
+    prefix = 'PHONEBOOK_{0}_'.format(section.upper())
+    return {key[len(prefix):].lower(): value
+            for key, value in os.environ.items() if key.startswith(prefix)}
+
+
+def load_config(filename='database.ini', section='postgresql'):
+    """Return the section parameters as a read-only mapping"""
+    section = SECTION_ALIASES.get(section, section)
+    sections = _read_sections(filename)
+
+    overrides = _env_overrides(section)
+    if section not in sections and not overrides:
         raise Exception('Section {0} not found in the {1} file'.format(section, filename))
 
-    return db
\ No newline at end of file
+    db = dict(sections.get(section, {}))
+    db.update(overrides)
+    return MappingProxyType(db)
+
+
+def config(filename='database.ini', section='postgresql'):
+    # plain dict copy so callers can keep doing psycopg2.connect(**config())
+    return dict(load_config(filename, section))
@@ -0,0 +1,236 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from config import config
+from instrumentation import InstrumentedCursor, record_wait
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out in time"""
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """Connection that remembers which registered statements it has PREPAREd.
+
+    Its cursors are InstrumentedCursors, so every statement is timed.
+    last_used is when the pool last got it back.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.cursor_factory = InstrumentedCursor
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+
+    Keeps between minconn and maxconn connections open. getconn() hands out
+    an idle connection (hit) or opens a new one while below maxconn (miss);
+    otherwise it waits up to `timeout` seconds for one to be returned.
+    With health_check, a connection idle for more than health_check_idle
+    seconds is pinged before it is handed out.
+    """
+
+    def __init__(self, minconn=1, maxconn=5, timeout=5.0, health_check=True,
+                 health_check_idle=30.0, **params):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check = health_check
+        self.health_check_idle = health_check_idle
+        self.params = params
+
+        self._idle = []
+        self._size = 0  # idle + checked out
+        self._cond = threading.Condition()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'discarded': 0,
+        }
+
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+            self._size += 1
+
+    def _connect(self):
+        return psycopg2.connect(connection_factory=PreparedConnection, **self.params)
+
+    def _is_alive(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < self.health_check_idle:
+            # recently used: skip the ping round trips
+            return True
+        try:
+            # plain cursor: the ping is not a statement of the calling operation
+            cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        waited = False
+        conn = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    self._stats['hits'] += 1
+                    break
+                if self._size < self.maxconn:
+                    # reserve a slot, connect outside the lock
+                    self._size += 1
+                    self._stats['misses'] += 1
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        'No connection available after {0:.1f}s'.format(self.timeout))
+                waited = True
+                self._cond.wait(remaining)
+
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += time.perf_counter() - start
+
+        if conn is not None and self.health_check and not self._is_alive(conn):
+            with self._cond:
+                self._stats['discarded'] += 1
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        # checkout time, including any wait, health check or new connection
+        record_wait((time.perf_counter() - start) * 1000)
+        return conn
+
+    def putconn(self, conn):
+        if not conn.closed:
+            status = conn.get_transaction_status()
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    conn.close()
+
+        with self._cond:
+            if conn.closed:
+                self._size -= 1
+                self._stats['discarded'] += 1
+            else:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            for conn in self._idle:
+                conn.close()
+            self._size -= len(self._idle)
+            self._idle = []
+
+    def stats(self):
+        """Snapshot of the pool counters"""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot['size'] = self._size
+            snapshot['idle'] = len(self._idle)
+        checkouts = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_ratio'] = snapshot['hits'] / checkouts if checkouts else 0.0
+        return snapshot
+
+
+# Prepared statement registry: name -> SQL with $1, $2 ... placeholders
+_statements = {}
+
+
+def register_statement(name, sql):
+    """Register a hot statement, returns its name for execute_prepared()"""
+    if _statements.get(name, sql) != sql:
+        raise ValueError(f"prepared statement {name!r} is already registered with different SQL")
+    _statements[name] = sql
+    return name
+
+
+def execute_prepared(cur, name, args=()):
+    """Run a registered statement by name, PREPAREing it on first use per connection.
+
+    The cursor must belong to a pooled connection. Prepared statements live
+    for the whole session and survive rollbacks, so the server parses and
+    plans each statement once per connection instead of once per call.
+    """
+    conn = cur.connection
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {name} AS {_statements[name]}")
+        conn.prepared.add(name)
+    if args:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(args))})", args)
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            try:
+                settings = config(section='pool')
+            except Exception:
+                settings = {}
+            _pool = ConnectionPool(
+                minconn=int(settings.get('minconn', 1)),
+                maxconn=int(settings.get('maxconn', 5)),
+                timeout=float(settings.get('timeout', 5)),
+                health_check=settings.get('health_check', 'yes').lower() in ('1', 'yes', 'true', 'on'),
+                health_check_idle=float(settings.get('health_check_idle', 30)),
+                **config()
+            )
+    return _pool
+
+
+@contextmanager
+def get_connection():
+    """Check a connection out of the pool and always give it back"""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def pool_stats():
+    if _pool is None:
+        return None
+    return _pool.stats()
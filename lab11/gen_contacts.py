@@ -0,0 +1,88 @@
+import argparse
+import csv
+import random
+
+FIRST_NAMES = [
+    'Alex', 'Maria', 'Ivan', 'Aruzhan', 'Daniyar', 'Aigerim', 'Nursultan', 'Dana',
+    'Timur', 'Alina', 'Arman', 'Kamila', 'Yerlan', 'Saule', 'Dmitry', 'Olga',
+    'Askar', 'Madina', 'Sergey', 'Anna', 'Bauyrzhan', 'Zhanna', 'Ruslan', 'Elena',
+    'Nurlan', 'Asel', 'Marat', 'Irina', 'Aidos', 'Gulnara', 'Pavel', 'Laura',
+]
+LAST_NAMES = [
+    'Brown', 'Green', 'Petrov', 'Ivanov', 'Smirnov', 'Nurlanov', 'Akhmetov', 'Omarov',
+    'Sadykov', 'Kim', 'Li', 'Tokayev', 'Abenov', 'Bekov', 'Kuznetsov', 'Popov',
+    'Serikbayev', 'Zhakupov', 'Karimov', 'Ermekov', 'Volkov', 'Morozov', 'Baimukhanov',
+    'Iskakov', 'Suleimenov', 'Utegenov', 'Kenzhebekov', 'Orlov', 'Lebedev', 'Mukanov',
+]
+INVALID_PHONES = ['', 'n/a', '123', 'call me', '+7 (777) ???']
+
+
+def contact_name(i):
+    """Unique (first_name, last_name) for row i, as phonebook_name_key requires"""
+    first = FIRST_NAMES[i % len(FIRST_NAMES)]
+    rest = i // len(FIRST_NAMES)
+    last = LAST_NAMES[rest % len(LAST_NAMES)]
+    suffix = rest // len(LAST_NAMES)
+    return first, f"{last}{suffix}" if suffix else last
+
+
+def contact_phone(i):
+    # 7919 is coprime with 10**10, so phones are unique for every i
+    return f"8{(7000000000 + i * 7919) % 10**10:010d}"
+
+
+def generate_contacts(filename, rows, duplicate_rate=0.01, invalid_rate=0.01, seed=42):
+    """Write `rows` contacts in the data.csv format, returns counts per kind.
+
+    counts['loadable'] is how many rows an importer keeping the first row per
+    phone ends up storing: three columns, a non-empty phone, not seen before.
+    """
+    rng = random.Random(seed)
+    counts = {'rows': rows, 'valid': 0, 'duplicate_phone': 0, 'invalid_phone': 0, 'malformed': 0,
+              'loadable': 0}
+    # contact_phone(j) already written; a duplicate of a row that got no phone is a new number
+    phone_written = bytearray(rows)
+    invalid_seen = set()
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['first_name', 'last_name', 'phone'])
+        for i in range(rows):
+            first, last = contact_name(i)
+            roll = rng.random()
+            if i > 0 and roll < duplicate_rate:
+                j = rng.randrange(i)
+                phone = contact_phone(j)
+                counts['duplicate_phone'] += 1
+                if not phone_written[j]:
+                    phone_written[j] = 1
+                    counts['loadable'] += 1
+            elif roll < duplicate_rate + invalid_rate:
+                if rng.random() < 0.2:
+                    # missing column
+                    writer.writerow([first, last])
+                    counts['malformed'] += 1
+                    continue
+                phone = rng.choice(INVALID_PHONES)
+                counts['invalid_phone'] += 1
+                if phone and phone not in invalid_seen:
+                    invalid_seen.add(phone)
+                    counts['loadable'] += 1
+            else:
+                phone = contact_phone(i)
+                counts['valid'] += 1
+                phone_written[i] = 1
+                counts['loadable'] += 1
+            writer.writerow([first, last, phone])
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic contacts CSV")
+    parser.add_argument('filename')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--duplicate-rate', type=float, default=0.01)
+    parser.add_argument('--invalid-rate', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    print(generate_contacts(args.filename, args.rows, args.duplicate_rate,
+                            args.invalid_rate, args.seed))
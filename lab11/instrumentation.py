@@ -0,0 +1,223 @@
+import bisect
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2.extensions
+from config import config
+
+# Upper bounds of the latency buckets in milliseconds, the last bucket is open
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Fixed log-spaced buckets, so memory stays constant however many calls are seen"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (capped at max)"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else None,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max,
+        }
+
+
+class Recorder:
+    """Per-operation latency, row and connection-wait histograms plus a slow-query log.
+
+    Statements are filed under the operation running in the current thread
+    (see operation()), or under their own verb / prepared statement name.
+    """
+
+    def __init__(self, slow_ms=200.0, slow_log='slow_queries.log', enabled=True):
+        self.slow_ms = slow_ms
+        self.slow_log = slow_log
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def _op(self, name):
+        op = self._ops.get(name)
+        if op is None:
+            op = self._ops[name] = {'latency': Histogram(), 'wait': Histogram(),
+                                    'rows': 0, 'errors': 0}
+        return op
+
+    def record(self, name, ms, rows=None, error=False, query=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            op = self._op(name)
+            op['latency'].add(ms)
+            if rows is not None:
+                op['rows'] += rows
+            if error:
+                op['errors'] += 1
+        if query is not None and self.slow_log:
+            line = (f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{name}\t{ms:.1f} ms\t"
+                    f"rows={rows if rows is not None else '-'}\t{' '.join(query.split())}\n")
+            with self._lock, open(self.slow_log, 'a') as f:
+                f.write(line)
+
+    def record_wait(self, name, ms):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._op(name)['wait'].add(ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {'latency': op['latency'].snapshot(), 'wait': op['wait'].snapshot(),
+                           'rows': op['rows'], 'errors': op['errors']}
+                    for name, op in self._ops.items()}
+
+    def reset(self):
+        with self._lock:
+            self._ops = {}
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_recorder():
+    """Return the process-wide recorder, configured from the [instrumentation] section"""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            try:
+                settings = config(section='instrumentation')
+            except Exception:
+                settings = {}
+            _recorder = Recorder(
+                slow_ms=float(settings.get('slow_ms', 200)),
+                slow_log=settings.get('slow_log', 'slow_queries.log'),
+                enabled=settings.get('enabled', 'yes').lower() in ('1', 'yes', 'true', 'on'),
+            )
+    return _recorder
+
+
+def current_operation():
+    return getattr(_local, 'operation', None)
+
+
+@contextmanager
+def operation(name):
+    """File every statement run by this thread inside the block under `name`"""
+    outer = current_operation()
+    _local.operation = name
+    try:
+        yield
+    finally:
+        _local.operation = outer
+
+
+def instrumented(func):
+    """Decorator: run func as an operation named after it"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with operation(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def statement_label(query):
+    """Operation name for a statement run outside operation(): EXECUTE name or the verb"""
+    if current_operation():
+        return current_operation()
+    words = query.split(None, 2) if isinstance(query, str) else []
+    if not words:
+        return 'sql'
+    if words[0].upper() == 'EXECUTE' and len(words) > 1:
+        return words[1].split('(')[0]
+    return words[0].upper()
+
+
+def record_wait(ms):
+    """Connection checkout time, called by the pool"""
+    get_recorder().record_wait(current_operation() or 'checkout', ms)
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """Cursor that times every statement and counts the rows it touched"""
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+    def callproc(self, procname, parameters=None):
+        return self._timed(super().callproc, procname, parameters)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, file, size)
+
+    def _query_text(self, query):
+        if isinstance(self.query, bytes):
+            return self.query.decode('utf-8', 'replace')[:1000]
+        return str(query)[:1000]
+
+    def _timed(self, method, query, *args):
+        recorder = get_recorder()
+        start = time.perf_counter()
+        error = True
+        try:
+            result = method(query, *args)
+            error = False
+            return result
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            rows = self.rowcount if self.rowcount >= 0 else None
+            slow = self._query_text(query) if ms >= recorder.slow_ms else None
+            recorder.record(statement_label(query), ms, rows, error, slow)
+
+
+def print_summary():
+    stats = get_recorder().snapshot()
+    print("\n--- Latency (ms) ---")
+    if not stats:
+        print("Nothing recorded yet")
+        return
+    print(f"{'operation':24} {'calls':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>9} "
+          f"{'rows':>9} {'errors':>6} {'wait p95':>9}")
+    for name in sorted(stats):
+        op = stats[name]
+        lat, wait = op['latency'], op['wait']
+        if not lat['count']:
+            # checkouts with no statement filed under this name yet
+            print(f"{name:24} {'-':>7} {'':>8} {'':>8} {'':>8} {'':>9} {'':>9} {'':>6} "
+                  f"{wait['p95_ms']:9.2f}")
+            continue
+        wait_p95 = f"{wait['p95_ms']:9.2f}" if wait['count'] else f"{'-':>9}"
+        print(f"{name:24} {lat['count']:7} {lat['p50_ms']:8.2f} {lat['p95_ms']:8.2f} "
+              f"{lat['p99_ms']:8.2f} {lat['max_ms']:9.2f} {op['rows']:9} {op['errors']:6} {wait_p95}")
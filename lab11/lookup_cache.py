@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+
+from change_listener import get_listener
+from config import config
+
+# ILIKE wildcards: such patterns cannot be checked with a plain substring test
+WILDCARDS = ('%', '_', '\\')
+
+
+def pattern_matches(pattern, row):
+    """Could a row (first, last, phone) be returned for an ILIKE '%pattern%' search?"""
+    if any(ch in pattern for ch in WILDCARDS):
+        return True
+    needle = pattern.lower()
+    return any(needle in (value or '').lower() for value in row)
+
+
+class LookupCache:
+    """In-process LRU + TTL cache for search results.
+
+    Keys are tuples whose second item is the search pattern, e.g.
+    ('pattern', 'Ivan') or ('ranked', 'Ivan', 50). Entries are dropped when
+    a change notification mentions a row the pattern would match. While the
+    listener is disconnected the cache is bypassed, since invalidations
+    could be missed.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60.0, max_rows=1000, listener=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows  # larger results are streamed, not cached
+        self.listener = listener
+
+        self._entries = OrderedDict()  # key -> (expires_at, rows)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    def active(self):
+        return self.listener is None or self.listener.connected.is_set()
+
+    def generation(self):
+        """Token to pass to put(), taken before running the query"""
+        with self._lock:
+            return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def put(self, key, rows, generation):
+        with self._lock:
+            # a change arrived while the query ran: the rows may be stale
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, rows)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+    def invalidate_rows(self, rows):
+        with self._lock:
+            self._generation += 1
+            stale = [key for key in self._entries
+                     if any(pattern_matches(key[1], row) for row in rows)]
+            for key in stale:
+                del self._entries[key]
+            self._stats['invalidations'] += len(stale)
+
+    def handle_change(self, payload):
+        rows = payload.get('rows')
+        if payload.get('op') == 'flush' or rows is None:
+            self.clear()
+        else:
+            self.invalidate_rows(rows)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = len(self._entries)
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_ratio'] = snapshot['hits'] / lookups if lookups else 0.0
+        return snapshot
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide cache, wired to the change listener"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            try:
+                settings = config(section='cache')
+            except Exception:
+                settings = {}
+            listener = get_listener()
+            _cache = LookupCache(
+                max_entries=int(settings.get('max_entries', 1024)),
+                ttl=float(settings.get('ttl', 60)),
+                max_rows=int(settings.get('max_rows', 1000)),
+                listener=listener,
+            )
+            listener.add_handler(_cache.handle_change)
+    return _cache
@@ -0,0 +1,115 @@
+import re
+
+import psycopg2
+from config import config
+
+# Versioned schema migrations.
+#
+# A migration is a dict: {'version': 1, 'name': '...', 'steps': [...]}
+# with optional 'online': True. Steps are SQL strings or callables taking
+# the migration connection.
+#  - Regular migrations run all steps and record their version in one
+#    transaction, so they apply completely or not at all.
+#  - Online migrations run every step on its own in autocommit mode, as
+#    CREATE INDEX CONCURRENTLY requires. Their steps must be idempotent
+#    (IF NOT EXISTS, ...): a failed run is retried from the first step.
+#    An invalid index left behind by an interrupted concurrent build is
+#    dropped before it is built again.
+
+CONCURRENT_INDEX = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+
+
+def ensure_migrations_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            scope VARCHAR(50) NOT NULL,
+            version INTEGER NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (scope, version)
+        )
+    """)
+
+
+def applied_versions(cur, scope):
+    cur.execute("SELECT version FROM schema_migrations WHERE scope = %s", (scope,))
+    return {row[0] for row in cur.fetchall()}
+
+
+def drop_invalid_index(cur, step):
+    """Drop the leftover of a failed CREATE INDEX CONCURRENTLY, if there is one"""
+    match = CONCURRENT_INDEX.search(step)
+    if match is None:
+        return
+    cur.execute("""SELECT NOT i.indisvalid FROM pg_index i
+                   WHERE i.indexrelid = to_regclass(%s)""", (match.group(1),))
+    row = cur.fetchone()
+    if row and row[0]:
+        print(f"Dropping invalid index {match.group(1)} from an interrupted build")
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+def run_step(conn, cur, step, online):
+    if callable(step):
+        step(conn)
+        return
+    if online:
+        drop_invalid_index(cur, step)
+    cur.execute(step)
+
+
+def apply_migration(conn, scope, migration):
+    cur = conn.cursor()
+    record = "INSERT INTO schema_migrations (scope, version, name) VALUES (%s, %s, %s)"
+    params = (scope, migration['version'], migration['name'])
+    if migration.get('online'):
+        conn.autocommit = True
+        for step in migration['steps']:
+            run_step(conn, cur, step, online=True)
+        cur.execute(record, params)
+    else:
+        conn.autocommit = False
+        try:
+            for step in migration['steps']:
+                run_step(conn, cur, step, online=False)
+            cur.execute(record, params)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+    cur.close()
+
+
+def migrate(migrations, scope):
+    """Apply the pending migrations of `scope` in version order, returns their versions.
+
+    A session advisory lock per scope keeps two processes from migrating
+    at the same time; the second one waits and then finds nothing to do.
+    """
+    conn = psycopg2.connect(**config())
+    try:
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_lock(hashtext(%s))", ('schema_migrations:' + scope,))
+        try:
+            ensure_migrations_table(cur)
+            done = applied_versions(cur, scope)
+            applied = []
+            for migration in sorted(migrations, key=lambda m: m['version']):
+                if migration['version'] in done:
+                    continue
+                apply_migration(conn, scope, migration)
+                print(f"Applied {scope} migration {migration['version']}: {migration['name']}")
+                applied.append(migration['version'])
+            if not applied:
+                print(f"{scope} schema is up to date (version {max(done, default=0)})")
+            return applied
+        finally:
+            conn.autocommit = True
+            cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", ('schema_migrations:' + scope,))
+            cur.close()
+    finally:
+        conn.close()
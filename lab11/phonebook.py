@@ -1,5 +1,20 @@
+import atexit
+import itertools
+import json
+import os
+import sys
+import time
 import psycopg2
 from config import config
+from db_pool import get_connection, register_statement, execute_prepared
+from migrate import migrate
+from instrumentation import InstrumentedCursor, instrumented, print_summary
+from batch_mode import parse_args, run_batch
+from lookup_cache import get_cache
+from autocomplete import complete, get_autocomplete
+
+# rows fetched per round trip by server-side cursors
+ITERSIZE = 2000
 
 # --- SQL SECTION: Stored Procedures & Functions ---
 sql_create_functions = """
@@ -25,47 +40,41 @@ CREATE OR REPLACE PROCEDURE add_or_update_user(
 LANGUAGE plpgsql
 AS $$
 BEGIN
-    IF EXISTS (SELECT 1 FROM phonebook WHERE first_name = p_first_name AND last_name = p_last_name) THEN
-        -- User exists: Update phone
-        UPDATE phonebook SET phone = p_phone WHERE first_name = p_first_name AND last_name = p_last_name;
-    ELSE
-        -- User new: Insert
-        INSERT INTO phonebook (first_name, last_name, phone) VALUES (p_first_name, p_last_name, p_phone);
-    END IF;
+    -- Single atomic statement: insert, or update the phone of the existing user
+    INSERT INTO phonebook (first_name, last_name, phone) VALUES (p_first_name, p_last_name, p_phone)
+    ON CONFLICT (first_name, last_name) DO UPDATE SET phone = EXCLUDED.phone;
 END;
 $$;
 
 -- 3. Insert List with Validation (Returns invalid data)
+-- Set-based: one unnest() pass validates, one INSERT ... ON CONFLICT upserts
 CREATE OR REPLACE FUNCTION insert_many_users(
-    first_names VARCHAR[], 
-    last_names VARCHAR[], 
+    first_names VARCHAR[],
+    last_names VARCHAR[],
     phones VARCHAR[]
 )
 RETURNS TABLE (bad_first_name VARCHAR, bad_last_name VARCHAR, bad_phone VARCHAR, error_msg VARCHAR) AS $$
-DECLARE
-    i INTEGER;
-    len INTEGER;
-    chk_phone VARCHAR;
-BEGIN
-    len := array_length(phones, 1);
-    
-    FOR i IN 1..len LOOP
-        chk_phone := phones[i];
-        
-        -- Validation: Phone must be digits only and length >= 10
-        IF (chk_phone ~ '^[0-9]+$') AND (length(chk_phone) >= 10) THEN
-            CALL add_or_update_user(first_names[i], last_names[i], chk_phone);
-        ELSE
-            -- Invalid data: Return it
-            bad_first_name := first_names[i];
-            bad_last_name := last_names[i];
-            bad_phone := chk_phone;
-            error_msg := 'Invalid Phone Format';
-            RETURN NEXT;
-        END IF;
-    END LOOP;
-END;
-$$ LANGUAGE plpgsql;
+    WITH input AS (
+        SELECT u.ord, u.f_name, u.l_name, u.phone,
+               -- Validation: Phone must be digits only and length >= 10
+               COALESCE(u.phone ~ '^[0-9]+$' AND length(u.phone) >= 10, FALSE) AS valid
+        FROM unnest(first_names, last_names, phones) WITH ORDINALITY AS u(f_name, l_name, phone, ord)
+    ),
+    upserted AS (
+        -- a name repeated in the list keeps its last phone, as the row-by-row loop did
+        INSERT INTO phonebook (first_name, last_name, phone)
+        SELECT DISTINCT ON (f_name, l_name) f_name, l_name, phone
+        FROM input
+        WHERE valid
+        ORDER BY f_name, l_name, ord DESC
+        ON CONFLICT (first_name, last_name) DO UPDATE SET phone = EXCLUDED.phone
+    )
+    -- Invalid data: Return it
+    SELECT f_name, l_name, phone, 'Invalid Phone Format'::VARCHAR
+    FROM input
+    WHERE NOT valid
+    ORDER BY ord;
+$$ LANGUAGE sql;
 
 -- 4. Get users with Pagination
 CREATE OR REPLACE FUNCTION get_users_paginated(limit_val INTEGER, offset_val INTEGER)
@@ -80,6 +89,8 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- 5. Delete User by Name or Phone
+-- (first_name is served by phonebook_name_key, last_name by phonebook_last_name_idx,
+--  phones by phonebook_phone_norm_key)
 CREATE OR REPLACE PROCEDURE delete_user_proc(criteria VARCHAR)
 LANGUAGE plpgsql
 AS $$
@@ -87,46 +98,725 @@ BEGIN
     DELETE FROM phonebook 
     WHERE first_name = criteria 
        OR last_name = criteria 
-       OR phone = criteria;
+       OR phone_norm = normalize_phone(criteria);
+END;
+$$;
+
+-- 5b. Batch delete: many names/phones per call, committed in bounded chunks
+-- Must be CALLed outside a transaction block (autocommit) so it can COMMIT.
+CREATE OR REPLACE PROCEDURE delete_users_batch(
+    criteria VARCHAR[],
+    chunk_size INTEGER DEFAULT 5000,
+    INOUT deleted_per_chunk INTEGER[] DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    n INTEGER;
+BEGIN
+    deleted_per_chunk := '{}';
+    LOOP
+        DELETE FROM phonebook
+        WHERE id IN (
+            SELECT p.id FROM phonebook p
+            WHERE p.first_name = ANY(criteria)
+               OR p.last_name = ANY(criteria)
+               OR p.phone_norm = ANY(ARRAY(SELECT normalize_phone(c) FROM unnest(criteria) c))
+            LIMIT chunk_size
+        );
+        GET DIAGNOSTICS n = ROW_COUNT;
+        EXIT WHEN n = 0;
+        deleted_per_chunk := deleted_per_chunk || n;
+        -- release locks before the next chunk
+        COMMIT;
+        EXIT WHEN n < chunk_size;
+    END LOOP;
+END;
+$$;
+
+-- 5c. Exact phone lookup in any format (normalize_phone and phone_norm come from lab10)
+CREATE OR REPLACE FUNCTION get_user_by_phone(phone_text VARCHAR)
+RETURNS TABLE (id INTEGER, first_name VARCHAR, last_name VARCHAR, phone VARCHAR) AS $$
+    SELECT p.id, p.first_name, p.last_name, p.phone
+    FROM phonebook p
+    WHERE p.phone_norm = normalize_phone(phone_text);
+$$ LANGUAGE sql STABLE;
+
+-- 6. Ranked search backed by the trigram indexes
+CREATE OR REPLACE FUNCTION search_users_ranked(pattern_text VARCHAR, limit_val INTEGER DEFAULT 50)
+RETURNS TABLE (id INTEGER, first_name VARCHAR, last_name VARCHAR, phone VARCHAR, score REAL) AS $$
+    SELECT p.id, p.first_name, p.last_name, p.phone,
+           GREATEST(similarity(p.first_name, pattern_text),
+                    similarity(COALESCE(p.last_name, ''), pattern_text),
+                    similarity(p.phone, pattern_text)) AS score
+    FROM phonebook p
+    WHERE p.first_name ILIKE '%' || pattern_text || '%'
+       OR p.last_name ILIKE '%' || pattern_text || '%'
+       OR p.phone ILIKE '%' || pattern_text || '%'
+    ORDER BY score DESC, p.id
+    LIMIT limit_val;
+$$ LANGUAGE sql STABLE;
+
+-- 7. Keyset pagination: rows after (or before) the last seen (sort value, id)
+CREATE OR REPLACE FUNCTION get_users_keyset(
+    sort_key VARCHAR,
+    after_val VARCHAR,
+    after_id INTEGER,
+    limit_val INTEGER,
+    backward BOOLEAN DEFAULT FALSE
+)
+RETURNS TABLE (id INTEGER, first_name VARCHAR, last_name VARCHAR, phone VARCHAR) AS $$
+DECLARE
+    sort_expr TEXT;
+    where_sql TEXT := '';
+    cmp TEXT := CASE WHEN backward THEN '<' ELSE '>' END;
+    dir TEXT := CASE WHEN backward THEN 'DESC' ELSE 'ASC' END;
+BEGIN
+    sort_expr := CASE sort_key
+        WHEN 'id' THEN 'p.id'
+        WHEN 'first_name' THEN 'p.first_name'
+        WHEN 'last_name' THEN 'COALESCE(p.last_name, '''')'
+    END;
+    IF sort_expr IS NULL THEN
+        RAISE EXCEPTION 'Unsupported sort key: %', sort_key;
+    END IF;
+
+    -- no cursor yet: first page (or last page when paging backwards)
+    IF after_id IS NOT NULL THEN
+        IF sort_key = 'id' THEN
+            where_sql := format('WHERE p.id %s $2', cmp);
+        ELSE
+            where_sql := format('WHERE (%s, p.id) %s ($1, $2)', sort_expr, cmp);
+        END IF;
+    END IF;
+
+    -- the inner query walks the index, the outer one restores ascending order
+    RETURN QUERY EXECUTE format(
+        'SELECT page.id, page.first_name, page.last_name, page.phone FROM (
+             SELECT p.id, p.first_name, p.last_name, p.phone, %1$s AS sort_val
+             FROM phonebook p %2$s
+             ORDER BY %1$s %3$s, p.id %3$s
+             LIMIT $3
+         ) page
+         ORDER BY page.sort_val, page.id',
+        sort_expr, where_sql, dir)
+    USING after_val, after_id, limit_val;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- 8. Change notifications for client-side caches (one NOTIFY per statement)
+CREATE OR REPLACE FUNCTION phonebook_notify_change()
+RETURNS trigger AS $$
+DECLARE
+    changed JSON;
+    payload TEXT;
+    n INTEGER := 0;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT count(*), json_agg(json_build_array(r.first_name, r.last_name, r.phone))
+        INTO n, changed
+        FROM (SELECT first_name, last_name, phone FROM new_rows LIMIT 101) r;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT count(*), json_agg(json_build_array(r.first_name, r.last_name, r.phone))
+        INTO n, changed
+        FROM (SELECT first_name, last_name, phone FROM old_rows LIMIT 101) r;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT count(*), json_agg(json_build_array(r.first_name, r.last_name, r.phone))
+        INTO n, changed
+        FROM (SELECT first_name, last_name, phone FROM old_rows
+              UNION ALL
+              SELECT first_name, last_name, phone FROM new_rows
+              LIMIT 101) r;
+    END IF;
+
+    -- TRUNCATE and big changes just tell listeners to drop everything;
+    -- NOTIFY payloads must stay under 8000 bytes, not characters
+    payload := json_build_object('op', TG_OP, 'rows', changed)::text;
+    IF TG_OP = 'TRUNCATE' OR n > 100 OR octet_length(payload) >= 8000 THEN
+        PERFORM pg_notify('phonebook_changed', '{"op": "flush"}');
+    ELSIF n > 0 THEN
+        PERFORM pg_notify('phonebook_changed', payload);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS phonebook_notify_insert ON phonebook;
+CREATE TRIGGER phonebook_notify_insert AFTER INSERT ON phonebook
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION phonebook_notify_change();
+
+DROP TRIGGER IF EXISTS phonebook_notify_update ON phonebook;
+CREATE TRIGGER phonebook_notify_update AFTER UPDATE ON phonebook
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION phonebook_notify_change();
+
+DROP TRIGGER IF EXISTS phonebook_notify_delete ON phonebook;
+CREATE TRIGGER phonebook_notify_delete AFTER DELETE ON phonebook
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION phonebook_notify_change();
+
+DROP TRIGGER IF EXISTS phonebook_notify_truncate ON phonebook;
+CREATE TRIGGER phonebook_notify_truncate AFTER TRUNCATE ON phonebook
+    FOR EACH STATEMENT EXECUTE FUNCTION phonebook_notify_change();
+"""
+
+sql_fuzzy_search = """
+-- 9. Fuzzy name search: Double Metaphone keys (first_name_phon, last_name_phon)
+--    pick the candidates through an index, Levenshtein distance re-ranks only those
+CREATE OR REPLACE FUNCTION search_users_fuzzy(name_text VARCHAR, max_distance INTEGER DEFAULT 2, limit_val INTEGER DEFAULT 50)
+RETURNS TABLE (id INTEGER, first_name VARCHAR, last_name VARCHAR, phone VARCHAR, distance INTEGER) AS $$
+    WITH keys AS (
+        -- one key per word, so "Ivan Petrof" looks up both names
+        SELECT array_agg(DISTINCT dmetaphone(word)) FILTER (WHERE dmetaphone(word) <> '') AS k
+        FROM regexp_split_to_table(trim(name_text), '[[:space:]]+') AS word
+    ),
+    candidates AS (
+        SELECT p.id, p.first_name, p.last_name, p.phone FROM phonebook p, keys
+        WHERE p.first_name_phon = ANY(keys.k)
+        UNION
+        SELECT p.id, p.first_name, p.last_name, p.phone FROM phonebook p, keys
+        WHERE p.last_name_phon = ANY(keys.k)
+    ),
+    ranked AS (
+        -- levenshtein() takes at most 255 characters per argument
+        SELECT c.id, c.first_name, c.last_name, c.phone,
+               LEAST(levenshtein(left(lower(c.first_name), 255), left(lower(name_text), 255)),
+                     levenshtein(left(lower(COALESCE(c.last_name, '')), 255), left(lower(name_text), 255)),
+                     levenshtein(left(lower(c.first_name || ' ' || COALESCE(c.last_name, '')), 255),
+                                 left(lower(name_text), 255))) AS distance
+        FROM candidates c
+    )
+    SELECT r.id, r.first_name, r.last_name, r.phone, r.distance
+    FROM ranked r
+    WHERE r.distance <= max_distance
+    ORDER BY r.distance, r.id
+    LIMIT limit_val;
+$$ LANGUAGE sql STABLE;
+"""
+
+sql_row_counts = """
+-- 10. Row counts without scanning phonebook
+-- Exact: statement triggers append one delta row per statement, reads sum them
+CREATE TABLE IF NOT EXISTS phonebook_count_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    delta BIGINT NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION phonebook_count_change()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO phonebook_count_deltas (delta)
+        SELECT count(*) FROM new_rows HAVING count(*) > 0;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO phonebook_count_deltas (delta)
+        SELECT -count(*) FROM old_rows HAVING count(*) > 0;
+    ELSIF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM phonebook_count_deltas;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS phonebook_count_insert ON phonebook;
+CREATE TRIGGER phonebook_count_insert AFTER INSERT ON phonebook
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION phonebook_count_change();
+
+DROP TRIGGER IF EXISTS phonebook_count_delete ON phonebook;
+CREATE TRIGGER phonebook_count_delete AFTER DELETE ON phonebook
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION phonebook_count_change();
+
+DROP TRIGGER IF EXISTS phonebook_count_truncate ON phonebook;
+CREATE TRIGGER phonebook_count_truncate AFTER TRUNCATE ON phonebook
+    FOR EACH STATEMENT EXECUTE FUNCTION phonebook_count_change();
+
+-- First run: count once. The triggers above lock out writers until commit.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM phonebook_count_deltas) THEN
+        INSERT INTO phonebook_count_deltas (delta) SELECT count(*) FROM phonebook;
+    END IF;
 END;
 $$;
+
+CREATE OR REPLACE FUNCTION compact_phonebook_count()
+RETURNS VOID AS $$
+    WITH folded AS (DELETE FROM phonebook_count_deltas RETURNING delta)
+    INSERT INTO phonebook_count_deltas (delta) SELECT COALESCE(sum(delta), 0) FROM folded;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION phonebook_exact_count()
+RETURNS BIGINT AS $$
+DECLARE
+    total BIGINT;
+BEGIN
+    -- fold the delta rows into one once they pile up
+    IF (SELECT count(*) FROM (SELECT 1 FROM phonebook_count_deltas LIMIT 1001) d) > 1000 THEN
+        PERFORM compact_phonebook_count();
+    END IF;
+    SELECT COALESCE(sum(delta), 0) INTO total FROM phonebook_count_deltas;
+    RETURN total;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Estimates: planner statistics (pg_class.reltuples), no rows are read
+CREATE OR REPLACE FUNCTION estimate_phonebook_count()
+RETURNS BIGINT AS $$
+    -- reltuples scaled to the current table size, NULL before the first ANALYZE
+    SELECT CASE WHEN c.reltuples < 0 OR c.relpages = 0 THEN NULL
+                ELSE (c.reltuples / c.relpages
+                      * (pg_relation_size(c.oid) / current_setting('block_size')::INTEGER))::BIGINT
+           END
+    FROM pg_class c
+    WHERE c.oid = 'phonebook'::regclass;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION estimate_pattern_count(pattern_text VARCHAR)
+RETURNS BIGINT AS $$
+DECLARE
+    plan JSON;
+BEGIN
+    -- the planner's row estimate for the get_users_by_pattern filter
+    EXECUTE format('EXPLAIN (FORMAT JSON) SELECT 1 FROM phonebook p
+                    WHERE p.first_name ILIKE %1$L OR p.last_name ILIKE %1$L OR p.phone ILIKE %1$L',
+                   '%' || pattern_text || '%')
+    INTO plan;
+    RETURN (plan -> 0 -> 'Plan' ->> 'Plan Rows')::BIGINT;
+END;
+$$ LANGUAGE plpgsql STABLE;
+"""
+
+sql_change_feed = """
+-- 11. Change feed: updated_at on every row and a log of every change,
+--     deletes included, so syncs read O(changes) instead of the whole table
+ALTER TABLE phonebook ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION phonebook_touch()
+RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS phonebook_touch ON phonebook;
+CREATE TRIGGER phonebook_touch BEFORE UPDATE ON phonebook
+    FOR EACH ROW EXECUTE FUNCTION phonebook_touch();
+
+-- op: I insert, U update, D delete (tombstone with the old values), T truncate
+CREATE TABLE IF NOT EXISTS phonebook_changes (
+    change_id BIGSERIAL PRIMARY KEY,
+    txid BIGINT NOT NULL DEFAULT txid_current(),
+    op CHAR(1) NOT NULL,
+    contact_id INTEGER,
+    first_name VARCHAR(255),
+    last_name VARCHAR(255),
+    phone VARCHAR(50),
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS phonebook_changes_txid_idx ON phonebook_changes (txid, change_id);
+
+CREATE OR REPLACE FUNCTION phonebook_log_change()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO phonebook_changes (op, contact_id, first_name, last_name, phone)
+        SELECT 'I', id, first_name, last_name, phone FROM new_rows ORDER BY id;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO phonebook_changes (op, contact_id, first_name, last_name, phone)
+        SELECT 'U', id, first_name, last_name, phone FROM new_rows ORDER BY id;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO phonebook_changes (op, contact_id, first_name, last_name, phone)
+        SELECT 'D', id, first_name, last_name, phone FROM old_rows ORDER BY id;
+    ELSIF TG_OP = 'TRUNCATE' THEN
+        -- consumers must start over from a full export
+        INSERT INTO phonebook_changes (op) VALUES ('T');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS phonebook_log_insert ON phonebook;
+CREATE TRIGGER phonebook_log_insert AFTER INSERT ON phonebook
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION phonebook_log_change();
+
+DROP TRIGGER IF EXISTS phonebook_log_update ON phonebook;
+CREATE TRIGGER phonebook_log_update AFTER UPDATE ON phonebook
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION phonebook_log_change();
+
+DROP TRIGGER IF EXISTS phonebook_log_delete ON phonebook;
+CREATE TRIGGER phonebook_log_delete AFTER DELETE ON phonebook
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION phonebook_log_change();
+
+DROP TRIGGER IF EXISTS phonebook_log_truncate ON phonebook;
+CREATE TRIGGER phonebook_log_truncate AFTER TRUNCATE ON phonebook
+    FOR EACH STATEMENT EXECUTE FUNCTION phonebook_log_change();
+
+-- Watermark for the next sync: every transaction below it has finished,
+-- so no change with a smaller txid can show up later
+CREATE OR REPLACE FUNCTION phonebook_change_watermark()
+RETURNS BIGINT AS $$
+    SELECT txid_snapshot_xmin(txid_current_snapshot());
+$$ LANGUAGE sql STABLE;
+
+-- Log retention: drop changes every consumer has already read
+CREATE OR REPLACE FUNCTION prune_phonebook_changes(before_txid BIGINT)
+RETURNS BIGINT AS $$
+    WITH pruned AS (DELETE FROM phonebook_changes WHERE txid < before_txid RETURNING 1)
+    SELECT count(*) FROM pruned;
+$$ LANGUAGE sql;
 """
 
+sql_change_ids = """
+-- 12. Change notifications with contact ids. A statement too big to list in
+--     one NOTIFY sends its txid instead, listeners read the ids of that
+--     transaction from phonebook_changes rather than reloading everything
+CREATE OR REPLACE FUNCTION phonebook_notify_change()
+RETURNS trigger AS $$
+DECLARE
+    changed JSON;
+    ids JSON;
+    payload TEXT;
+    n INTEGER := 0;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('phonebook_changed', '{"op": "flush"}');
+        RETURN NULL;
+    ELSIF TG_OP = 'INSERT' THEN
+        SELECT count(*), json_agg(json_build_array(r.first_name, r.last_name, r.phone)), json_agg(r.id)
+        INTO n, changed, ids
+        FROM (SELECT id, first_name, last_name, phone FROM new_rows LIMIT 101) r;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT count(*), json_agg(json_build_array(r.first_name, r.last_name, r.phone)), json_agg(r.id)
+        INTO n, changed, ids
+        FROM (SELECT id, first_name, last_name, phone FROM old_rows LIMIT 101) r;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT count(*), json_agg(json_build_array(r.first_name, r.last_name, r.phone))
+        INTO n, changed
+        FROM (SELECT first_name, last_name, phone FROM old_rows
+              UNION ALL
+              SELECT first_name, last_name, phone FROM new_rows
+              LIMIT 101) r;
+        SELECT json_agg(r.id) INTO ids FROM (SELECT id FROM new_rows LIMIT 101) r;
+    END IF;
+
+    -- NOTIFY payloads must stay under 8000 bytes (not characters: Cyrillic names take two each)
+    payload := json_build_object('op', TG_OP, 'rows', changed, 'ids', ids)::text;
+    IF n > 100 OR octet_length(payload) >= 8000 THEN
+        PERFORM pg_notify('phonebook_changed', json_build_object('op', TG_OP, 'txid', txid_current())::text);
+    ELSIF n > 0 THEN
+        PERFORM pg_notify('phonebook_changed', payload);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+sql_count_reads = """
+-- 13. phonebook_exact_count() only reads: the delta rows are folded by
+--     writers (section 14) and compact_counts(), not on every page view
+CREATE OR REPLACE FUNCTION phonebook_exact_count()
+RETURNS BIGINT AS $$
+    SELECT COALESCE(sum(delta), 0)::BIGINT FROM phonebook_count_deltas;
+$$ LANGUAGE sql STABLE;
+"""
+
+sql_count_fold = """
+-- 14. Keep phonebook_count_deltas short from the write side: every 1000th
+--     delta row folds the table, one writer at a time, so reads never sum
+--     more than about a thousand rows between maintenance runs
+CREATE OR REPLACE FUNCTION phonebook_count_change()
+RETURNS trigger AS $$
+DECLARE
+    delta_id BIGINT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO phonebook_count_deltas (delta)
+        SELECT count(*) FROM new_rows HAVING count(*) > 0
+        RETURNING id INTO delta_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO phonebook_count_deltas (delta)
+        SELECT -count(*) FROM old_rows HAVING count(*) > 0
+        RETURNING id INTO delta_id;
+    ELSIF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM phonebook_count_deltas;
+    END IF;
+    IF delta_id % 1000 = 0 AND pg_try_advisory_xact_lock(hashtext('phonebook_count_deltas')) THEN
+        PERFORM compact_phonebook_count();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+def require_lab10_schema(conn):
+    """The phonebook table, phone_norm and normalize_phone() are created by lab10"""
+    cur = conn.cursor()
+    cur.execute("""SELECT to_regclass('phonebook') IS NOT NULL
+                     AND to_regproc('normalize_phone') IS NOT NULL
+                     AND EXISTS (SELECT 1 FROM pg_attribute
+                                 WHERE attrelid = to_regclass('phonebook')
+                                   AND attname = 'phone_norm' AND NOT attisdropped)""")
+    ready = cur.fetchone()[0]
+    cur.close()
+    if not ready:
+        raise Exception('phonebook schema is missing phone_norm/normalize_phone(), '
+                        'run lab10 (create_tables) against this database first')
+
+def check_no_duplicate_names(conn):
+    """phonebook_name_key cannot be built while a (first_name, last_name) repeats"""
+    cur = conn.cursor()
+    cur.execute("""SELECT to_regclass('phonebook_name_key') IS NULL
+                   AND EXISTS (SELECT 1 FROM phonebook GROUP BY first_name, last_name HAVING count(*) > 1)""")
+    duplicates = cur.fetchone()[0]
+    cur.close()
+    if duplicates:
+        raise Exception('phonebook has duplicate (first_name, last_name) rows, merge them before creating phonebook_name_key')
+
+# --- MIGRATIONS: applied once each by migrate.py, recorded in schema_migrations ---
+# Indexes are built CONCURRENTLY in online migrations, so a loaded phonebook keeps
+# taking writes meanwhile. Changed SQL goes into a new version, never an old one.
+MIGRATIONS = [
+    {'version': 1, 'name': 'search and pagination indexes', 'online': True, 'steps': [
+        require_lab10_schema,
+        # trigram indexes for substring search
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_first_name_trgm_idx ON phonebook USING gin (first_name gin_trgm_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_last_name_trgm_idx ON phonebook USING gin (last_name gin_trgm_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_phone_trgm_idx ON phonebook USING gin (phone gin_trgm_ops)",
+        # keyset pagination (sort key, id)
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_first_name_id_idx ON phonebook (first_name, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_last_name_id_idx ON phonebook ((COALESCE(last_name, '')), id)",
+        # delete_user_proc by last name
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_last_name_idx ON phonebook (last_name)",
+        # a person is identified by (first_name, last_name): upsert conflict target
+        check_no_duplicate_names,
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS phonebook_name_key ON phonebook (first_name, last_name)",
+    ]},
+    {'version': 2, 'name': 'functions, procedures and change notifications', 'steps': [
+        # get_user_by_phone is LANGUAGE sql: its body is checked when it is created
+        require_lab10_schema,
+        sql_create_functions,
+    ]},
+    {'version': 3, 'name': 'phonetic key columns', 'online': True, 'steps': [
+        "CREATE EXTENSION IF NOT EXISTS fuzzystrmatch",
+        "ALTER TABLE phonebook ADD COLUMN IF NOT EXISTS first_name_phon TEXT GENERATED ALWAYS AS (dmetaphone(first_name)) STORED",
+        "ALTER TABLE phonebook ADD COLUMN IF NOT EXISTS last_name_phon TEXT GENERATED ALWAYS AS (dmetaphone(last_name)) STORED",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_first_name_phon_idx ON phonebook (first_name_phon)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_last_name_phon_idx ON phonebook (last_name_phon)",
+    ]},
+    {'version': 4, 'name': 'fuzzy search function', 'steps': [sql_fuzzy_search]},
+    {'version': 5, 'name': 'row counter', 'steps': [sql_row_counts]},
+    {'version': 6, 'name': 'change feed', 'steps': [sql_change_feed]},
+    {'version': 7, 'name': 'updated_at index', 'online': True, 'steps': [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_updated_at_idx ON phonebook (updated_at)",
+    ]},
+    {'version': 8, 'name': 'contact ids in change notifications', 'steps': [sql_change_ids]},
+    # prefix matches of complete_from_db(), used when the autocomplete index is over max_rows
+    {'version': 9, 'name': 'autocomplete prefix indexes', 'online': True, 'steps': [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_first_name_prefix_idx ON phonebook (lower(first_name) text_pattern_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_last_name_prefix_idx ON phonebook (lower(last_name) text_pattern_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS phonebook_phone_digits_prefix_idx ON phonebook (regexp_replace(phone, '[^0-9]', '', 'g') text_pattern_ops)",
+    ]},
+    {'version': 10, 'name': 'read-only exact count', 'steps': [sql_count_reads]},
+    # versions 2 and 8 measured the NOTIFY payload in characters; replace the function
+    # on databases that already applied them
+    {'version': 11, 'name': 'notify payload size in bytes', 'steps': [sql_change_ids]},
+    {'version': 12, 'name': 'bounded count deltas', 'steps': [sql_count_fold]},
+    # nothing filters on updated_at (the feed reads phonebook_changes), and indexing a
+    # column every UPDATE sets rules out HOT updates
+    {'version': 13, 'name': 'drop updated_at index', 'online': True, 'steps': [
+        "DROP INDEX CONCURRENTLY IF EXISTS phonebook_updated_at_idx",
+    ]},
+    # the generated phonetic keys of migration 3 become plain columns set by a trigger,
+    # like phone_norm in lab10; DROP EXPRESSION keeps the stored values, no rewrite
+    {'version': 14, 'name': 'phonetic keys set by trigger', 'steps': [
+        "ALTER TABLE phonebook ALTER COLUMN first_name_phon DROP EXPRESSION IF EXISTS",
+        "ALTER TABLE phonebook ALTER COLUMN last_name_phon DROP EXPRESSION IF EXISTS",
+        """
+        CREATE OR REPLACE FUNCTION phonebook_set_phonetic_keys() RETURNS trigger AS $$
+        BEGIN
+            NEW.first_name_phon := dmetaphone(NEW.first_name);
+            NEW.last_name_phon := dmetaphone(NEW.last_name);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS phonebook_phonetic_keys ON phonebook",
+        """
+        CREATE TRIGGER phonebook_phonetic_keys BEFORE INSERT OR UPDATE OF first_name, last_name ON phonebook
+            FOR EACH ROW EXECUTE FUNCTION phonebook_set_phonetic_keys()
+        """,
+    ]},
+]
+
+# Hot statements, PREPAREd once per pooled connection and run by name
+SEARCH_PATTERN = register_statement('search_pattern', "SELECT * FROM get_users_by_pattern($1)")
+SEARCH_RANKED = register_statement('search_ranked', "SELECT * FROM search_users_ranked($1, $2)")
+INSERT_MANY = register_statement('insert_many', "SELECT * FROM insert_many_users($1, $2, $3)")
+PAGINATED = register_statement('paginated', "SELECT * FROM get_users_paginated($1, $2)")
+KEYSET_PAGE = register_statement('keyset_page', "SELECT * FROM get_users_keyset($1, $2, $3, $4, $5)")
+FIND_BY_PHONE = register_statement('find_by_phone', "SELECT * FROM get_user_by_phone($1)")
+SEARCH_FUZZY = register_statement('search_fuzzy', "SELECT * FROM search_users_fuzzy($1, $2, $3)")
+EXACT_COUNT = register_statement('exact_count', "SELECT phonebook_exact_count()")
+ESTIMATE_PATTERN = register_statement('estimate_pattern', "SELECT estimate_pattern_count($1)")
+CHANGE_WATERMARK = register_statement('change_watermark', "SELECT phonebook_change_watermark()")
+
 # --- PYTHON SECTION ---
 
+@instrumented
 def init_db_functions():
-    """Create all SQL functions in Database"""
-    conn = None
+    """Apply the pending schema migrations (indexes, SQL functions)"""
     try:
-        conn = psycopg2.connect(**config())
-        cur = conn.cursor()
-        cur.execute(sql_create_functions)
-        conn.commit()
-        cur.close()
-        print("SQL Functions created successfully.")
+        migrate(MIGRATIONS, 'lab11')
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
-    finally:
-        if conn: conn.close()
+
+# Streaming helpers: rows stay on the server until the client asks for them
+def stream_rows(sql, params=None, itersize=ITERSIZE):
+    """Yield query rows from a named server-side cursor"""
+    with get_connection() as conn:
+        cur = conn.cursor(name='phonebook_stream')
+        cur.itersize = itersize
+        cur.execute(sql, params)
+        for row in cur:
+            yield row
+        cur.close()
+        conn.commit()
+
+def prepared_rows(name, args):
+    """Run a registered statement and fetch all rows (for bounded results)"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        execute_prepared(cur, name, args)
+        rows = cur.fetchall()
+        cur.close()
+        conn.commit()
+    return rows
+
+def write_rows(rows, chunk_size=1000):
+    """Print rows to sys.stdout in chunks of lines, returns how many were written"""
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(f"{row}\n")
+        if len(chunk) >= chunk_size:
+            sys.stdout.writelines(chunk)
+            count += len(chunk)
+            chunk = []
+    sys.stdout.writelines(chunk)
+    return count + len(chunk)
+
+# Read-through lookup cache, invalidated by LISTEN/NOTIFY
+def cached_rows(key, sql, params, prepared=None):
+    """Serve rows from the lookup cache, or stream them and cache small results.
+
+    With `prepared` the rows come from that registered statement instead of
+    a server-side cursor over `sql`.
+    """
+    cache = get_cache()
+    if cache.active():
+        rows = cache.get(key)
+        if rows is not None:
+            yield from rows
+            return
+    generation = cache.generation()
+    collected = []
+    source = prepared_rows(prepared, params) if prepared else stream_rows(sql, params)
+    for row in source:
+        if collected is not None:
+            collected.append(row)
+            if len(collected) > cache.max_rows:
+                collected = None
+        yield row
+    if collected is not None and cache.active():
+        cache.put(key, collected, generation)
 
 # Task 1: Search
+@instrumented
 def search_user():
     pattern = input("\nSearch (name/phone): ")
     sql = "SELECT * FROM get_users_by_pattern(%s);"
     try:
-        conn = psycopg2.connect(**config())
-        cur = conn.cursor()
-        cur.execute(sql, (pattern,))
-        rows = cur.fetchall()
-        print(f"\nMatches found: {len(rows)}")
+        # planner estimate first, so a huge result is announced before it streams
+        estimate, _ = count_users(pattern)
+        print(f"\nAbout {estimate} matches")
+        count = write_rows(cached_rows(('pattern', pattern), sql, (pattern,)))
+        print(f"Matches found: {count}")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+
+# Task 1b: Ranked search (trigram indexes)
+@instrumented
+def search_user_ranked():
+    pattern = input("\nSearch (name/phone): ")
+    try:
+        limit = int(input("Max results: ") or 50)
+    except ValueError:
+        limit = 50
+
+    sql = "SELECT * FROM search_users_ranked(%s, %s);"
+    try:
+        # at most `limit` rows, so the prepared statement can fetch them in one go
+        rows = list(cached_rows(('ranked', pattern, limit), sql, (pattern, limit), prepared=SEARCH_RANKED))
+        print(f"\nTop {len(rows)} matches:")
         for row in rows:
-            print(row)
-        cur.close()
-        conn.close()
+            print(f"{row[:4]}  score={row[4]:.2f}")
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
 
+# Task 1e: Fuzzy name search (phonetic keys + edit distance)
+@instrumented
+def search_user_fuzzy():
+    name = input("\nName (misspellings welcome): ")
+    try:
+        max_distance = int(input("Max edit distance [2]: ") or 2)
+    except ValueError:
+        max_distance = 2
+    try:
+        rows = prepared_rows(SEARCH_FUZZY, (name, max_distance, 50))
+        print(f"\n{len(rows)} matches:")
+        for row in rows:
+            print(f"{row[:4]}  distance={row[4]}")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+
+# Task 1c: Lookup cache counters
+def show_cache_stats():
+    stats = get_cache().stats()
+    print("\n--- Lookup Cache ---")
+    print(f"Entries: {stats['size']}  Hit ratio: {stats['hit_ratio']:.2%}")
+    print(f"Hits: {stats['hits']}  Misses: {stats['misses']}")
+    print(f"Evictions: {stats['evictions']}  Expirations: {stats['expirations']}  "
+          f"Invalidations: {stats['invalidations']}")
+
+# Task 1d: Typeahead (in-memory prefix index)
+def autocomplete_mode():
+    stats = get_autocomplete().stats()
+    source = f"{stats['entries']} keys in memory" if stats['ready'] else "server fallback"
+    print(f"\nAutocomplete ({source}), empty line to stop")
+    while True:
+        prefix = input("> ")
+        if not prefix:
+            break
+        try:
+            start = time.perf_counter()
+            rows = complete(prefix)
+            elapsed = (time.perf_counter() - start) * 1e6
+            for row in rows:
+                print(f"  {row}")
+            print(f"  {len(rows)} completions in {elapsed:.0f} us")
+        except (Exception, psycopg2.DatabaseError) as error:
+            print(error)
+
 # Task 2: Procedure Add/Update
+@instrumented
 def add_user_proc():
     f_name = input("First Name: ")
     l_name = input("Last Name: ")
@@ -134,17 +824,17 @@ def add_user_proc():
     
     sql = "CALL add_or_update_user(%s, %s, %s);"
     try:
-        conn = psycopg2.connect(**config())
-        cur = conn.cursor()
-        cur.execute(sql, (f_name, l_name, phone))
-        conn.commit()
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, (f_name, l_name, phone))
+            conn.commit()
+            cur.close()
         print("User saved via Procedure.")
-        cur.close()
-        conn.close()
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
 
 # Task 3: Insert List
+@instrumented
 def insert_list_mode():
     # Test Data: 2 valid, 2 invalid
     names_f = ["Alice", "Bob", "Charlie", "David"]
@@ -153,67 +843,329 @@ def insert_list_mode():
     
     print(f"\nProcessing list of {len(names_f)} users...")
 
-    sql = "SELECT * FROM insert_many_users(%s, %s, %s);"
     try:
-        conn = psycopg2.connect(**config())
-        cur = conn.cursor()
-        cur.execute(sql, (names_f, names_l, phones))
-        incorrect_data = cur.fetchall()
-        conn.commit()
-        
+        with get_connection() as conn:
+            cur = conn.cursor()
+            execute_prepared(cur, INSERT_MANY, (names_f, names_l, phones))
+            incorrect_data = cur.fetchall()
+            conn.commit()
+            cur.close()
+
         if incorrect_data:
             print("--- Skipped Invalid Data ---")
             for row in incorrect_data:
                 print(f"Error: {row[0]} {row[1]} ({row[2]}) -> {row[3]}")
         else:
             print("All data valid and inserted.")
-            
-        cur.close()
-        conn.close()
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
 
 # Task 4: Pagination
+@instrumented
 def query_pagination():
     try:
         limit = int(input("Limit (rows): "))
         offset = int(input("Offset (skip): "))
     except ValueError:
         return
+    if limit <= 0 or offset < 0:
+        print("Limit must be positive and offset not negative")
+        return
 
     sql = "SELECT * FROM get_users_paginated(%s, %s);"
     try:
-        conn = psycopg2.connect(**config())
+        # total from the counter table, no COUNT(*) scan
+        total, _ = count_users()
+        print(f"\n--- Page {offset // limit + 1} of {-(-total // limit)} ({total} contacts) ---")
+        # the page streams from a server-side cursor; one extra row tells whether a next page exists
+        rows = stream_rows(sql, (limit + 1, offset))
+        try:
+            write_rows(itertools.islice(rows, limit))
+            has_next = next(rows, None) is not None
+        finally:
+            rows.close()
+        if has_next:
+            print(f"More: next offset {offset + limit}")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+
+# Task 4a: Counts without a table scan
+def count_users(pattern=None):
+    """Returns (count, exact): counter-table total, or an estimate for a pattern"""
+    with get_connection() as conn:
         cur = conn.cursor()
-        cur.execute(sql, (limit, offset))
-        rows = cur.fetchall()
-        print(f"\n--- Page Result ---")
-        for row in rows:
-            print(row)
+        if pattern is None:
+            execute_prepared(cur, EXACT_COUNT)
+            exact = True
+        else:
+            execute_prepared(cur, ESTIMATE_PATTERN, (pattern,))
+            exact = False
+        count = cur.fetchone()[0]
         cur.close()
-        conn.close()
+        conn.commit()
+    return count, exact
+
+def compact_counts():
+    """Maintenance: fold the per-statement count deltas into one row"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT compact_phonebook_count()")
+        conn.commit()
+        cur.close()
+
+# Task 4b: Keyset pagination
+SORT_KEYS = ('id', 'first_name', 'last_name')
+
+def sort_value(row, sort_key):
+    """Cursor value of an (id, first_name, last_name, phone) row"""
+    if sort_key == 'first_name':
+        return row[1]
+    if sort_key == 'last_name':
+        return row[2] or ''
+    return None
+
+def fetch_keyset_page(cur, sort_key, edge, page_size, backward=False):
+    """One page after (or before) the edge row, always in ascending order"""
+    if edge is None:
+        after_val, after_id = None, None
+    else:
+        after_val, after_id = sort_value(edge, sort_key), edge[0]
+    execute_prepared(cur, KEYSET_PAGE, (sort_key, after_val, after_id, page_size, backward))
+    return cur.fetchall()
+
+def iter_users_keyset(page_size=100, sort_key='id', backward=False):
+    """Walk the whole phonebook page by page at constant cost per page"""
+    if sort_key not in SORT_KEYS:
+        raise ValueError(f"sort_key must be one of {SORT_KEYS}")
+    with get_connection() as conn:
+        cur = conn.cursor()
+        edge = None
+        while True:
+            rows = fetch_keyset_page(cur, sort_key, edge, page_size, backward)
+            conn.commit()
+            if not rows:
+                break
+            yield rows
+            if len(rows) < page_size:
+                break
+            edge = rows[0] if backward else rows[-1]
+        cur.close()
+
+@instrumented
+def query_keyset_pagination():
+    try:
+        page_size = int(input("Page size: "))
+    except ValueError:
+        return
+    sort_key = input("Sort by (id/first_name/last_name) [id]: ") or 'id'
+    if sort_key not in SORT_KEYS:
+        print("Unknown sort key")
+        return
+
+    try:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            rows = fetch_keyset_page(cur, sort_key, None, page_size)
+            conn.commit()
+            while True:
+                print(f"\n--- Page Result ---")
+                for row in rows:
+                    print(row)
+                step = input("[n]ext, [p]revious, [q]uit: ").lower()
+                if step not in ('n', 'p') or not rows:
+                    break
+                backward = step == 'p'
+                edge = rows[0] if backward else rows[-1]
+                page = fetch_keyset_page(cur, sort_key, edge, page_size, backward)
+                conn.commit()
+                if page:
+                    rows = page
+                else:
+                    print("No more rows.")
+            cur.close()
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+
+# Task 4c: Phone lookup
+@instrumented
+def find_by_phone():
+    phone = input("Phone (any format): ")
+    try:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            execute_prepared(cur, FIND_BY_PHONE, (phone,))
+            row = cur.fetchone()
+            conn.commit()
+            cur.close()
+        print(row if row else "Not found")
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
 
 # Task 5: Delete
+@instrumented
 def delete_user_proc():
     criteria = input("Delete by Name/Phone: ")
     sql = "CALL delete_user_proc(%s);"
     try:
-        conn = psycopg2.connect(**config())
-        cur = conn.cursor()
-        cur.execute(sql, (criteria,))
-        conn.commit()
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, (criteria,))
+            conn.commit()
+            cur.close()
         print("Delete executed.")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+
+# Task 5b: Batch delete
+def delete_users_batch(criteria, chunk_size=5000):
+    """Delete every contact matching any name/phone, returns rows deleted per chunk"""
+    sql = "CALL delete_users_batch(%s, %s, NULL);"
+    conn = psycopg2.connect(cursor_factory=InstrumentedCursor, **config())
+    try:
+        # the procedure commits between chunks, which needs autocommit mode
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(sql, (list(criteria), chunk_size))
+        deleted_per_chunk = cur.fetchone()[0]
         cur.close()
+        return deleted_per_chunk
+    finally:
         conn.close()
+
+@instrumented
+def delete_batch_mode():
+    source = input("File with one name/phone per line (or comma list): ")
+    try:
+        with open(source, 'r') as f:
+            criteria = [line.strip() for line in f if line.strip()]
+    except OSError:
+        criteria = [value.strip() for value in source.split(',') if value.strip()]
+    if not criteria:
+        return
+
+    try:
+        chunks = delete_users_batch(criteria)
+        for i, n in enumerate(chunks, 1):
+            print(f"Chunk {i}: deleted {n} rows")
+        print(f"Deleted {sum(chunks)} rows for {len(criteria)} criteria.")
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+
+# Task 6: Change feed (deltas since a watermark)
+def change_watermark():
+    """Upper bound for a sync: all changes with a smaller txid are committed"""
+    return prepared_rows(CHANGE_WATERMARK, ())[0][0]
+
+def changes_since(watermark, upto=None, itersize=ITERSIZE):
+    """Stream the changes with watermark <= txid < upto in (txid, change_id) order.
+
+    Store `upto` atomically together with the consumed rows and pass it as
+    the next watermark; every change is then delivered exactly once.
+    Storing it in a separate step gives at-least-once delivery instead.
+    """
+    if upto is None:
+        upto = change_watermark()
+    sql = """SELECT change_id, txid, op, contact_id, first_name, last_name, phone, changed_at
+             FROM phonebook_changes
+             WHERE txid >= %s AND txid < %s
+             ORDER BY txid, change_id"""
+    yield from stream_rows(sql, (watermark, upto), itersize)
+
+def save_export_state(state_path, watermark, size):
+    """Replace "<watermark> <size of the output>" in one atomic rename"""
+    with open(state_path + '.tmp', 'w') as f:
+        f.write(f"{watermark} {size}")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(state_path + '.tmp', state_path)
+
+@instrumented
+def export_changes():
+    out_path = input("Write changes to (JSONL): ")
+    # "<watermark> <size of out_path>" as of the last completed export
+    state_path = out_path + '.watermark'
+    try:
+        with open(state_path, 'r') as f:
+            watermark, size = (int(value) for value in f.read().split())
+    except FileNotFoundError:
+        if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+            print(f"{out_path} already has data but no {state_path}, choose a new file")
+            return
+        # recorded before anything is written, so a crashed first export is truncated too
+        watermark, size = 0, 0
+        save_export_state(state_path, watermark, size)
+    except (OSError, ValueError):
+        # includes the old one-value format: the file may hold rows past the watermark
+        print(f"{state_path} is not a '<watermark> <size>' state, choose a new file")
+        return
+
+    try:
+        upto = change_watermark()
+        count = 0
+        with open(out_path, 'a+b') as out:
+            # drop rows an interrupted export appended after the last saved state,
+            # they are exported again below: each change ends up in the file once
+            out.truncate(size)
+            for row in changes_since(watermark, upto):
+                change = dict(zip(('change_id', 'txid', 'op', 'id', 'first_name', 'last_name',
+                                   'phone', 'changed_at'), row))
+                out.write((json.dumps(change, default=str) + "\n").encode('utf-8'))
+                count += 1
+            out.flush()
+            os.fsync(out.fileno())
+            size = out.tell()
+        save_export_state(state_path, upto, size)
+        print(f"Exported {count} changes (watermark {watermark} -> {upto})")
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
 
+def backend_engine():
+    """Storage engine from the [backend] section: postgresql (default) or sqlite"""
+    try:
+        return config(section='backend').get('engine', 'postgresql').lower()
+    except Exception:
+        return 'postgresql'
+
+# Batch mode: handler(cur, command) per op, see batch_mode.py
+BATCH_OPS = {
+    'add': lambda cur, c: cur.execute("CALL add_or_update_user(%s, %s, %s);",
+                                      (c['first_name'], c.get('last_name', ''), c['phone'])),
+    'update': lambda cur, c: cur.execute("CALL add_or_update_user(%s, %s, %s);",
+                                         (c['first_name'], c.get('last_name', ''), c['phone'])),
+    'delete': lambda cur, c: cur.execute("CALL delete_user_proc(%s);",
+                                         (c.get('criteria') or c['phone'],)),
+    'search': lambda cur, c: execute_prepared(cur, SEARCH_PATTERN, (c.get('pattern') or c['phone'],)),
+}
+
 # --- MAIN ---
 if __name__ == '__main__':
+    if backend_engine() == 'sqlite':
+        # Embedded storage, no server needed
+        import sqlite_backend
+        sqlite_backend.run_menu()
+        sys.exit()
+
+    # --stats prints the latency summary on exit
+    if '--stats' in sys.argv:
+        atexit.register(print_summary)
     # Initialize SQL procedures first
     init_db_functions()
+    # Count maintenance, also runnable alone (e.g. from cron): python phonebook.py --compact-counts
+    try:
+        compact_counts()
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+    if '--compact-counts' in sys.argv:
+        sys.exit()
+    # python phonebook.py --batch commands.jsonl [--results FILE] [--group-size N]
+    if '--batch' in sys.argv:
+        args = parse_args(sys.argv[1:])
+        run_batch(args.batch, BATCH_OPS, args.results, args.group_size)
+        sys.exit()
+    # Start listening for changes before the first cached lookup
+    get_cache()
+    # Typeahead index, kept current by the same listener
+    get_autocomplete()
     
     while True:
         print("\n--- MENU ---")
@@ -222,7 +1174,16 @@ if __name__ == '__main__':
         print("3. Insert List (Loop/Check)")
         print("4. Pagination")
         print("5. Delete (Procedure)")
-        print("6. Exit")
+        print("6. Search (Ranked)")
+        print("7. Pagination (Keyset)")
+        print("8. Cache Stats")
+        print("9. Delete Batch (Procedure)")
+        print("10. Find by Phone")
+        print("11. Latency Stats")
+        print("12. Autocomplete")
+        print("13. Search (Fuzzy)")
+        print("14. Export Changes")
+        print("15. Exit")
         
         choice = input("Choice: ")
         
@@ -231,4 +1192,13 @@ if __name__ == '__main__':
         elif choice == '3': insert_list_mode()
         elif choice == '4': query_pagination()
         elif choice == '5': delete_user_proc()
-        elif choice == '6': break
\ No newline at end of file
+        elif choice == '6': search_user_ranked()
+        elif choice == '7': query_keyset_pagination()
+        elif choice == '8': show_cache_stats()
+        elif choice == '9': delete_batch_mode()
+        elif choice == '10': find_by_phone()
+        elif choice == '11': print_summary()
+        elif choice == '12': autocomplete_mode()
+        elif choice == '13': search_user_fuzzy()
+        elif choice == '14': export_changes()
+        elif choice == '15': break
\ No newline at end of file
@@ -0,0 +1,81 @@
+import asyncio
+
+import asyncpg
+from config import config
+
+# Same operations as phonebook.py, for services that fan out many lookups.
+# Every function takes a pool from create_pool() and returns plain tuples.
+
+
+async def create_pool(min_size=5, max_size=20):
+    params = config()
+    return await asyncpg.create_pool(
+        host=params.get('host'),
+        port=int(params.get('port', 5432)),
+        user=params.get('user'),
+        password=params.get('password') or None,
+        database=params.get('database'),
+        min_size=min_size,
+        max_size=max_size,
+    )
+
+
+async def search_users(pool, pattern):
+    rows = await pool.fetch("SELECT * FROM get_users_by_pattern($1);", pattern)
+    return [tuple(row) for row in rows]
+
+
+async def search_users_ranked(pool, pattern, limit=50):
+    rows = await pool.fetch("SELECT * FROM search_users_ranked($1, $2);", pattern, limit)
+    return [tuple(row) for row in rows]
+
+
+async def add_or_update_user(pool, first_name, last_name, phone):
+    await pool.execute("CALL add_or_update_user($1, $2, $3);", first_name, last_name, phone)
+
+
+async def insert_many_users(pool, first_names, last_names, phones):
+    """Returns the rejected rows: (first_name, last_name, phone, error_msg)"""
+    rows = await pool.fetch("SELECT * FROM insert_many_users($1, $2, $3);",
+                            first_names, last_names, phones)
+    return [tuple(row) for row in rows]
+
+
+async def get_users_paginated(pool, limit, offset):
+    rows = await pool.fetch("SELECT * FROM get_users_paginated($1, $2);", limit, offset)
+    return [tuple(row) for row in rows]
+
+
+async def get_users_keyset(pool, sort_key='id', after_val=None, after_id=None,
+                           limit=100, backward=False):
+    rows = await pool.fetch("SELECT * FROM get_users_keyset($1, $2, $3, $4, $5);",
+                            sort_key, after_val, after_id, limit, backward)
+    return [tuple(row) for row in rows]
+
+
+async def delete_user(pool, criteria):
+    await pool.execute("CALL delete_user_proc($1);", criteria)
+
+
+async def search_many(pool, patterns, concurrency=100):
+    """Run many searches at once, at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(pattern):
+        async with semaphore:
+            return await search_users(pool, pattern)
+
+    return await asyncio.gather(*(one(pattern) for pattern in patterns))
+
+
+if __name__ == '__main__':
+    async def main():
+        pool = await create_pool()
+        try:
+            pattern = input("Search (name/phone): ")
+            for row in await search_users(pool, pattern):
+                print(row)
+        finally:
+            await pool.close()
+
+    asyncio.run(main())
@@ -0,0 +1,286 @@
+import csv
+import sqlite3
+
+from config import config
+
+# Embedded storage with the same operations as the PostgreSQL functions.
+# WAL journal, batched executemany and an FTS5 trigram index for search.
+# Every write runs in `with conn:`, so it commits or rolls back as a whole,
+# like a PostgreSQL function call does.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS phonebook (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name TEXT NOT NULL,
+    last_name TEXT,
+    phone TEXT NOT NULL UNIQUE
+);
+CREATE UNIQUE INDEX IF NOT EXISTS phonebook_name_key ON phonebook (first_name, last_name);
+CREATE INDEX IF NOT EXISTS phonebook_last_name_idx ON phonebook (last_name);
+CREATE INDEX IF NOT EXISTS phonebook_first_name_id_idx ON phonebook (first_name, id);
+CREATE INDEX IF NOT EXISTS phonebook_last_name_id_idx ON phonebook (COALESCE(last_name, ''), id);
+
+-- Substring search index, kept in sync by triggers
+CREATE VIRTUAL TABLE IF NOT EXISTS phonebook_fts USING fts5(
+    first_name, last_name, phone,
+    content='phonebook', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS phonebook_fts_insert AFTER INSERT ON phonebook BEGIN
+    INSERT INTO phonebook_fts (rowid, first_name, last_name, phone)
+    VALUES (new.id, new.first_name, new.last_name, new.phone);
+END;
+CREATE TRIGGER IF NOT EXISTS phonebook_fts_delete AFTER DELETE ON phonebook BEGIN
+    INSERT INTO phonebook_fts (phonebook_fts, rowid, first_name, last_name, phone)
+    VALUES ('delete', old.id, old.first_name, old.last_name, old.phone);
+END;
+CREATE TRIGGER IF NOT EXISTS phonebook_fts_update AFTER UPDATE ON phonebook BEGIN
+    INSERT INTO phonebook_fts (phonebook_fts, rowid, first_name, last_name, phone)
+    VALUES ('delete', old.id, old.first_name, old.last_name, old.phone);
+    INSERT INTO phonebook_fts (rowid, first_name, last_name, phone)
+    VALUES (new.id, new.first_name, new.last_name, new.phone);
+END;
+"""
+
+COLUMNS = "p.id, p.first_name, p.last_name, p.phone"
+BATCH_SIZE = 5000
+SORT_EXPRS = {
+    'id': 'p.id',
+    'first_name': 'p.first_name',
+    'last_name': "COALESCE(p.last_name, '')",
+}
+
+
+def connect(path=None):
+    """Open (and create if needed) the database file from the [sqlite] section"""
+    if path is None:
+        try:
+            path = config(section='sqlite').get('path', 'phonebook.db')
+        except Exception:
+            path = 'phonebook.db'
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    create_tables(conn)
+    return conn
+
+
+def create_tables(conn):
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+
+def valid_phone(phone):
+    # same rule as insert_many_users: digits only, at least 10 of them
+    return bool(phone) and phone.isdigit() and phone.isascii() and len(phone) >= 10
+
+
+def insert_contact(conn, first_name, last_name, phone):
+    with conn:
+        cur = conn.execute("INSERT INTO phonebook (first_name, last_name, phone) VALUES (?, ?, ?)",
+                           (first_name, last_name, phone))
+    return cur.lastrowid
+
+
+def insert_from_csv(conn, filename, batch_size=BATCH_SIZE):
+    """Stream a data.csv file in executemany batches; conflicting rows are skipped"""
+    sql = "INSERT INTO phonebook (first_name, last_name, phone) VALUES (?, ?, ?) ON CONFLICT DO NOTHING"
+    report = {'loaded': 0, 'duplicates': 0, 'malformed': 0}
+
+    def flush(batch):
+        # one transaction per batch; rowcount of executemany is the sum over the batch, triggers excluded
+        with conn:
+            loaded = conn.executemany(sql, batch).rowcount
+        report['loaded'] += loaded
+        report['duplicates'] += len(batch) - loaded
+
+    with open(filename, 'r', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None) # Skip header
+        batch = []
+        for row in reader:
+            if len(row) != 3 or not row[0] or not row[2]:
+                report['malformed'] += 1
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    return report
+
+
+def search_users(conn, pattern, limit=None):
+    """Substring match on name or phone, like get_users_by_pattern"""
+    if len(pattern) >= 3:
+        # trigram index: the quoted pattern matches as a substring of any column
+        sql = f"""SELECT {COLUMNS} FROM phonebook_fts f JOIN phonebook p ON p.id = f.rowid
+                  WHERE phonebook_fts MATCH ? ORDER BY p.id"""
+        params = ['"' + pattern.replace('"', '""') + '"']
+    else:
+        # too short for trigrams
+        sql = f"""SELECT {COLUMNS} FROM phonebook p
+                  WHERE p.first_name LIKE ? OR p.last_name LIKE ? OR p.phone LIKE ? ORDER BY p.id"""
+        params = ['%' + pattern + '%'] * 3
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+def add_or_update_user(conn, first_name, last_name, phone):
+    with conn:
+        conn.execute("""INSERT INTO phonebook (first_name, last_name, phone) VALUES (?, ?, ?)
+                        ON CONFLICT (first_name, last_name) DO UPDATE SET phone = excluded.phone""",
+                     (first_name, last_name, phone))
+
+
+def insert_many_users(conn, first_names, last_names, phones):
+    """Upsert the valid rows in one transaction, return the invalid ones"""
+    rows = list(zip(first_names, last_names, phones))
+    invalid = [(f, l, p, 'Invalid Phone Format') for f, l, p in rows if not valid_phone(p)]
+    with conn:
+        conn.executemany("""INSERT INTO phonebook (first_name, last_name, phone) VALUES (?, ?, ?)
+                            ON CONFLICT (first_name, last_name) DO UPDATE SET phone = excluded.phone""",
+                         [row for row in rows if valid_phone(row[2])])
+    return invalid
+
+
+def get_users_paginated(conn, limit, offset):
+    return conn.execute(f"SELECT {COLUMNS} FROM phonebook p ORDER BY p.id LIMIT ? OFFSET ?",
+                        (limit, offset)).fetchall()
+
+
+def get_users_keyset(conn, sort_key='id', after_val=None, after_id=None, limit=100, backward=False):
+    sort_expr = SORT_EXPRS.get(sort_key)
+    if sort_expr is None:
+        raise ValueError(f"sort_key must be one of {tuple(SORT_EXPRS)}")
+    cmp, direction = ('<', 'DESC') if backward else ('>', 'ASC')
+    where, params = '', []
+    if after_id is not None:
+        if sort_key == 'id':
+            where, params = f"WHERE p.id {cmp} ?", [after_id]
+        else:
+            where, params = f"WHERE ({sort_expr}, p.id) {cmp} (?, ?)", [after_val, after_id]
+    rows = conn.execute(f"""SELECT {COLUMNS} FROM phonebook p {where}
+                            ORDER BY {sort_expr} {direction}, p.id {direction} LIMIT ?""",
+                        params + [limit]).fetchall()
+    return rows[::-1] if backward else rows
+
+
+def update_contact(conn, phone, first_name):
+    with conn:
+        cur = conn.execute("UPDATE phonebook SET first_name = ? WHERE phone = ?", (first_name, phone))
+    return cur.rowcount
+
+
+def delete_user(conn, criteria):
+    with conn:
+        cur = conn.execute("DELETE FROM phonebook WHERE first_name = ? OR last_name = ? OR phone = ?",
+                           (criteria, criteria, criteria))
+    return cur.rowcount
+
+
+def delete_users_batch(conn, criteria, chunk_size=BATCH_SIZE):
+    """Delete contacts matching any name/phone in bounded chunks, returns rows per chunk"""
+    with conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS delete_criteria (value TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM delete_criteria")
+        conn.executemany("INSERT OR IGNORE INTO delete_criteria VALUES (?)", [(c,) for c in criteria])
+    deleted_per_chunk = []
+    while True:
+        # each chunk is its own transaction, as in delete_users_batch on PostgreSQL
+        with conn:
+            cur = conn.execute("""DELETE FROM phonebook WHERE id IN (
+                                      SELECT id FROM phonebook
+                                      WHERE first_name IN (SELECT value FROM delete_criteria)
+                                         OR last_name IN (SELECT value FROM delete_criteria)
+                                         OR phone IN (SELECT value FROM delete_criteria)
+                                      LIMIT ?)""", (chunk_size,))
+        if cur.rowcount <= 0:
+            break
+        deleted_per_chunk.append(cur.rowcount)
+        if cur.rowcount < chunk_size:
+            break
+    return deleted_per_chunk
+
+
+def keyset_mode(conn):
+    """Page through the table with [n]ext/[p]revious, like query_keyset_pagination"""
+    page_size = int(input("Page size: "))
+    sort_key = input("Sort by (id/first_name/last_name) [id]: ") or 'id'
+    rows = get_users_keyset(conn, sort_key, limit=page_size)
+    while True:
+        print("\n--- Page Result ---")
+        for row in rows:
+            print(row)
+        step = input("[n]ext, [p]revious, [q]uit: ").lower()
+        if step not in ('n', 'p') or not rows:
+            break
+        backward = step == 'p'
+        edge = rows[0] if backward else rows[-1]
+        after_val = {'id': None, 'first_name': edge[1], 'last_name': edge[2] or ''}[sort_key]
+        page = get_users_keyset(conn, sort_key, after_val, edge[0], page_size, backward)
+        if page:
+            rows = page
+        else:
+            print("No more rows.")
+
+
+def run_menu():
+    """Interactive menu, same options as phonebook.py on PostgreSQL"""
+    conn = connect()
+    try:
+        while True:
+            print("\n--- MENU (SQLite) ---")
+            print("1. Search")
+            print("2. Add/Update")
+            print("3. Insert List")
+            print("4. Pagination")
+            print("5. Delete")
+            print("6. Import CSV")
+            print("7. Update Name")
+            print("8. Pagination (Keyset)")
+            print("9. Delete Batch")
+            print("10. Exit")
+            choice = input("Choice: ")
+            try:
+                if choice == '1':
+                    rows = search_users(conn, input("\nSearch (name/phone): "))
+                    for row in rows:
+                        print(row)
+                    print(f"Matches found: {len(rows)}")
+                elif choice == '2':
+                    add_or_update_user(conn, input("First Name: "), input("Last Name: "), input("Phone: "))
+                    print("User saved.")
+                elif choice == '3':
+                    invalid = insert_many_users(conn, ["Alice", "Bob", "Charlie", "David"],
+                                                ["Wonder", "Builder", "Chocolate", "Error"],
+                                                ["87771112233", "wrong_phone", "87015556677", "123"])
+                    for row in invalid:
+                        print(f"Error: {row[0]} {row[1]} ({row[2]}) -> {row[3]}")
+                elif choice == '4':
+                    limit = int(input("Limit (rows): "))
+                    offset = int(input("Offset (skip): "))
+                    for row in get_users_paginated(conn, limit, offset):
+                        print(row)
+                elif choice == '5':
+                    print(f"Deleted {delete_user(conn, input('Delete by Name/Phone: '))} rows")
+                elif choice == '6':
+                    print(insert_from_csv(conn, input("Filename: ")))
+                elif choice == '7':
+                    updated = update_contact(conn, input("Phone of the contact: "), input("New First Name: "))
+                    print(f"Updated {updated} rows")
+                elif choice == '8':
+                    keyset_mode(conn)
+                elif choice == '9':
+                    source = input("Comma-separated names/phones: ")
+                    criteria = [value.strip() for value in source.split(',') if value.strip()]
+                    chunks = delete_users_batch(conn, criteria)
+                    print(f"Deleted {sum(chunks)} rows in {len(chunks)} chunks")
+                elif choice == '10':
+                    break
+            except (ValueError, OSError, sqlite3.Error) as error:
+                print(error)
+    finally:
+        conn.close()
@@ -0,0 +1,86 @@
+import argparse
+import threading
+import time
+
+import psycopg2
+from config import config
+
+# Writers share a small set of names, so most calls collide on the same rows
+NAME_PREFIX = 'Stress'
+
+
+def writer(writer_id, names, calls, errors, barrier):
+    conn = psycopg2.connect(**config())
+    cur = conn.cursor()
+    barrier.wait()
+    try:
+        for i in range(calls):
+            first_name = f"{NAME_PREFIX}{(writer_id + i) % names}"
+            # unique per call, so the phone UNIQUE constraint never interferes
+            phone = f"9{writer_id:03d}{i:07d}"
+            try:
+                cur.execute("CALL add_or_update_user(%s, %s, %s);", (first_name, 'Upsert', phone))
+                conn.commit()
+            except psycopg2.DatabaseError as error:
+                conn.rollback()
+                errors.append(str(error).strip())
+    finally:
+        cur.close()
+        conn.close()
+
+
+def run_stress(writers=16, calls=500, names=20):
+    """Run parallel add_or_update_user writers and check for duplicate users"""
+    conn = psycopg2.connect(**config())
+    cur = conn.cursor()
+    cur.execute("DELETE FROM phonebook WHERE first_name LIKE %s AND last_name = 'Upsert'",
+                (NAME_PREFIX + '%',))
+    conn.commit()
+
+    errors = []
+    barrier = threading.Barrier(writers + 1)
+    threads = [threading.Thread(target=writer, args=(w, names, calls, errors, barrier))
+               for w in range(writers)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    cur.execute("""
+        SELECT first_name, count(*) FROM phonebook
+        WHERE first_name LIKE %s AND last_name = 'Upsert'
+        GROUP BY first_name HAVING count(*) > 1
+    """, (NAME_PREFIX + '%',))
+    duplicates = cur.fetchall()
+    cur.execute("SELECT count(*) FROM phonebook WHERE first_name LIKE %s AND last_name = 'Upsert'",
+                (NAME_PREFIX + '%',))
+    distinct_rows = cur.fetchone()[0]
+
+    cur.execute("DELETE FROM phonebook WHERE first_name LIKE %s AND last_name = 'Upsert'",
+                (NAME_PREFIX + '%',))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    total = writers * calls
+    print(f"{writers} writers x {calls} calls in {elapsed:.2f}s -> {total / elapsed:.0f} upserts/s")
+    print(f"Rows: {distinct_rows} (expected {min(names, total)}), duplicates: {len(duplicates)}, errors: {len(errors)}")
+    for message in sorted(set(errors))[:5]:
+        print(f"  {message}")
+    return not duplicates and not errors and distinct_rows == min(names, total)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrent add_or_update_user stress test")
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--names', type=int, default=20)
+    args = parser.parse_args()
+    if run_stress(args.writers, args.calls, args.names):
+        print("OK: no duplicate users")
+    else:
+        print("FAIL")
+        raise SystemExit(1)
@@ -0,0 +1,130 @@
+import sqlite3
+
+import pytest
+
+import sqlite_backend as db
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = db.connect(str(tmp_path / 'phonebook.db'))
+    yield conn
+    conn.close()
+
+
+def count(conn):
+    return conn.execute("SELECT count(*) FROM phonebook").fetchone()[0]
+
+
+def add_people(conn, n):
+    db.insert_many_users(conn, [f"First{i}" for i in range(n)], [f"Last{i}" for i in range(n)],
+                         [f"870000000{i:02d}" for i in range(n)])
+
+
+def test_insert_contact(conn):
+    item_id = db.insert_contact(conn, 'Alice', 'Wonder', '87771112233')
+    assert conn.execute("SELECT first_name, phone FROM phonebook WHERE id = ?", (item_id,)).fetchone() == \
+        ('Alice', '87771112233')
+
+
+def test_insert_from_csv_skips_malformed_and_duplicates(conn, tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_text("first_name,last_name,phone\n"
+                    "Alice,Wonder,87771112233\n"
+                    "Bob,Builder\n"
+                    "Carol,King,87771112233\n"
+                    "Dan,Brown,87015556677\n")
+    report = db.insert_from_csv(conn, str(path), batch_size=2)
+    assert report == {'loaded': 2, 'duplicates': 1, 'malformed': 1}
+    assert count(conn) == 2
+
+
+def test_search_users(conn):
+    db.insert_contact(conn, 'Alice', 'Wonder', '87771112233')
+    db.insert_contact(conn, 'Bob', 'Builder', '87015556677')
+    assert [row[1] for row in db.search_users(conn, 'onde')] == ['Alice']
+    assert [row[1] for row in db.search_users(conn, '5556')] == ['Bob']
+    # shorter than a trigram: LIKE fallback
+    assert [row[1] for row in db.search_users(conn, 'Bo')] == ['Bob']
+    assert len(db.search_users(conn, 'b', limit=1)) == 1
+
+
+def test_search_index_follows_updates_and_deletes(conn):
+    db.insert_contact(conn, 'Alice', 'Wonder', '87771112233')
+    db.update_contact(conn, '87771112233', 'Alicia')
+    assert [row[1] for row in db.search_users(conn, 'Alicia')] == ['Alicia']
+    db.delete_user(conn, 'Alicia')
+    assert db.search_users(conn, 'Alicia') == []
+
+
+def test_add_or_update_user_upserts_by_name(conn):
+    db.add_or_update_user(conn, 'Alice', 'Wonder', '87771112233')
+    db.add_or_update_user(conn, 'Alice', 'Wonder', '87770000000')
+    assert conn.execute("SELECT phone FROM phonebook").fetchall() == [('87770000000',)]
+
+
+def test_insert_many_users_returns_invalid(conn):
+    invalid = db.insert_many_users(conn, ['Alice', 'Bob', 'Charlie'], ['Wonder', 'Builder', 'Chocolate'],
+                                   ['87771112233', 'wrong_phone', '123'])
+    assert [(row[0], row[3]) for row in invalid] == [('Bob', 'Invalid Phone Format'),
+                                                    ('Charlie', 'Invalid Phone Format')]
+    assert count(conn) == 1
+
+
+def test_insert_many_users_is_atomic(conn):
+    # the second row takes Alice's phone under another name: UNIQUE (phone) fails mid-batch
+    with pytest.raises(sqlite3.IntegrityError):
+        db.insert_many_users(conn, ['Dan', 'Eve', 'Alice'], ['Brown', 'Green', 'Wonder'],
+                             ['87015556677', '87771112233', '87771112233'])
+    assert count(conn) == 0
+    # a later write must not commit leftovers of the failed batch
+    db.insert_contact(conn, 'Frank', 'Ocean', '87050000000')
+    assert [row[0] for row in conn.execute("SELECT first_name FROM phonebook")] == ['Frank']
+
+
+def test_failed_upsert_rolls_back(conn):
+    db.insert_contact(conn, 'Alice', 'Wonder', '87771112233')
+    with pytest.raises(sqlite3.IntegrityError):
+        db.add_or_update_user(conn, 'Bob', 'Builder', '87771112233')
+    assert not conn.in_transaction
+    assert count(conn) == 1
+
+
+def test_get_users_paginated(conn):
+    add_people(conn, 5)
+    assert [row[1] for row in db.get_users_paginated(conn, 2, 1)] == ['First1', 'First2']
+
+
+def test_get_users_keyset(conn):
+    add_people(conn, 5)
+    first = db.get_users_keyset(conn, 'first_name', limit=2)
+    assert [row[1] for row in first] == ['First0', 'First1']
+    second = db.get_users_keyset(conn, 'first_name', first[-1][1], first[-1][0], 2)
+    assert [row[1] for row in second] == ['First2', 'First3']
+    back = db.get_users_keyset(conn, 'first_name', second[0][1], second[0][0], 2, backward=True)
+    assert back == first
+    by_id = db.get_users_keyset(conn, 'id', after_id=first[-1][0], limit=10)
+    assert len(by_id) == 3
+    with pytest.raises(ValueError):
+        db.get_users_keyset(conn, 'phone')
+
+
+def test_update_contact(conn):
+    db.insert_contact(conn, 'Alice', 'Wonder', '87771112233')
+    assert db.update_contact(conn, '87771112233', 'Alicia') == 1
+    assert db.update_contact(conn, '80000000000', 'Nobody') == 0
+    assert conn.execute("SELECT first_name FROM phonebook").fetchone() == ('Alicia',)
+
+
+def test_delete_user(conn):
+    db.insert_contact(conn, 'Alice', 'Wonder', '87771112233')
+    db.insert_contact(conn, 'Bob', 'Wonder', '87015556677')
+    assert db.delete_user(conn, 'Wonder') == 2
+    assert count(conn) == 0
+
+
+def test_delete_users_batch_in_chunks(conn):
+    add_people(conn, 7)
+    criteria = [f"First{i}" for i in range(5)] + ['87000000005', 'nobody']
+    assert db.delete_users_batch(conn, criteria, chunk_size=3) == [3, 3]
+    assert [row[1] for row in db.get_users_paginated(conn, 10, 0)] == ['First6']